@@ -1,12 +1,15 @@
-import configparser
+import argparse
 import warnings
+from contextlib import contextmanager
 from dataclasses import dataclass
+from functools import lru_cache
 from enum import Enum
 from pathlib import Path
 from pprint import pprint
-from typing import Dict, List, Optional, Tuple, Callable
+from typing import Dict, List, Optional, Tuple, Callable, Iterable, Iterator, Union
 
 import numpy as np
+import shapely
 
 from hydrolib.core.dflowfm import (
     CrossSection,
@@ -14,31 +17,38 @@ from hydrolib.core.dflowfm import (
     FrictGlobal,
     FrictBranch
 )
-from netCDF4 import Dataset
+from netCDF4 import Dataset, Variable, chartostring
 from osgeo import ogr, osr
-from shapely import Point
 from shapely.geometry import LineString
 
 from hydrolib_utils import check_structures, read_friction, read_cross_sections, ThreeDiCrossSectionData, \
     ThreeDiFrictionData, \
     BranchFrictionDefinition, count_structure_types, GenericFrictionDefinition, lists_to_csv, \
     CrossSectionShape, SUPPORTED_STRUCTURES, SUPPORTED_CROSS_SECTIONS, OGR_FIELD_TYPES, \
-    extract_from_ini, features_have_geometry
+    extract_from_ini, features_have_geometry, friction_files, friction_definitions_to_threedi
 
 ogr.UseExceptions()
 
+CROSS_SECTION_AND_FRICTION_FIELDS = ThreeDiCrossSectionData.fields | ThreeDiFrictionData.fields
 
-@dataclass
+# {object type: name of the object type as used in layer names and messages}
+FEATURE_TYPE_NAMES = {
+    object_type: object_type.__name__.lower()
+    for object_type in (*SUPPORTED_STRUCTURES, *SUPPORTED_CROSS_SECTIONS, FrictGlobal, FrictBranch)
+}
+
+
+@dataclass(slots=True)
 class LayerMapping:
     target_layer_name: str
     field_mapping: Optional[Dict] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class ReplacementConfig:
     get_from: str
     source_field: str
-    parser: Optional[Callable] = lambda x: x  # default simply returns the input value
+    parser: Optional[Callable] = None  # None means the input value is used as is
 
 
 class Proxy(str):
@@ -46,9 +56,8 @@ class Proxy(str):
 
 
 def _get_node(geometry: ogr.Geometry, index: int) -> ogr.Geometry:
-    x, y, _ = geometry.GetPoint(index)  # _ for z-coordinate if present
     point_geom = ogr.Geometry(ogr.wkbPoint)
-    point_geom.AddPoint(x, y)
+    point_geom.AddPoint_2D(geometry.GetX(index), geometry.GetY(index))
     return point_geom
 
 
@@ -63,13 +72,15 @@ def end_node(geometry: ogr.Geometry) -> ogr.Geometry:
 
 def reverse_line(geometry: ogr.Geometry) -> ogr.Geometry:
     reversed_line = ogr.Geometry(ogr.wkbLineString)
-    for i in range(geometry.GetPointCount() - 1, -1, -1):  # Iterate in reverse order
-        reversed_line.AddPoint(*geometry.GetPoint(i))
+    for x, y, *_ in reversed(geometry.GetPoints()):  # GetPoints() reads all vertices in one call
+        reversed_line.AddPoint_2D(x, y)
     return reversed_line
 
 
 # TODO Check if all pumps are suction side
 
+PUMP_TYPES = {"suctionSide": 1, "deliverySide": 2}  # D-Hydro controlside: 3Di pump type
+
 ORIFICE_TO_POSITIVE_PUMP_REPLACEMENT_CONFIG = {
     "geometry": ReplacementConfig(get_from="delete_layer", source_field="", parser=start_node),
     "id": ReplacementConfig(get_from="delete_layer", source_field="id"),
@@ -86,7 +97,7 @@ ORIFICE_TO_POSITIVE_PUMP_REPLACEMENT_CONFIG = {
     "type": ReplacementConfig(
         get_from="source",
         source_field="controlside",
-        parser=lambda x: 1 if x == "suctionSide" else 2 if x == "deliverySide" else None
+        parser=PUMP_TYPES.get
     ),
     "sewerage": ReplacementConfig(get_from="delete_layer", source_field="sewerage"),
     "connection_node_id": ReplacementConfig(get_from="delete_layer", source_field="connection_node_id_start"),
@@ -101,6 +112,12 @@ ORIFICE_TO_NEGATIVE_PUMP_REPLACEMENT_CONFIG["geometry"] = ReplacementConfig(
     parser=end_node
 )
 
+# (orientation, replacement config) for each pump orientation
+PUMP_ORIENTATION_CONFIGS = (
+    ("positive", ORIFICE_TO_POSITIVE_PUMP_REPLACEMENT_CONFIG),
+    ("negative", ORIFICE_TO_NEGATIVE_PUMP_REPLACEMENT_CONFIG),
+)
+
 
 connection_node_layer_mapping = LayerMapping(
     target_layer_name="connection_node",
@@ -129,89 +146,229 @@ cross_section_location_mapping = LayerMapping(
 )
 
 
-def extract_branches(network_file: Path) -> Dict:
+def _read_strings(variable: Variable) -> List[str]:
     """
-    Returns a {branch_id: branch_data} dict, in which branch data is itself a dict with the following keys:
+    Reads a netCDF char variable as a list of stripped strings.
+    Decoding is done by netCDF4 and NumPy in a single pass instead of joining the characters of each row in Python.
+    """
+    raw = variable[:]
+    if raw.dtype.kind == "S" and raw.ndim > 1:  # (N, L) char array that netCDF4 did not convert to strings
+        raw = chartostring(raw)
+    return np.char.strip(np.asarray(raw, dtype=str)).tolist()
 
-    - branch_id
-    - branch_long_name
-    - source_node_id
-    - target_node_id
-    - length
-    - order
-    - type
-    - geometry
 
+def geometries_to_wkb(source: Dict) -> List[bytes]:
     """
-    f = Dataset(network_file)
-    keys = {key.lower(): key for key in f.variables.keys()}  # some files have keys with first letter capitalized,
-                                                             # others all lower key
+    Returns the 2D WKB of the "geometry" of each feature in ``source``, in the same order as ``source``.
+    All geometries are encoded in a single call, so that no per-feature Python serialization and flattening to 2D is
+    needed.
+    """
+    geometries = np.array([src_feat["geometry"] for src_feat in source.values()], dtype=object)
+    return shapely.to_wkb(geometries, output_dimension=2).tolist()
+
+
+def get_field_indices(layer_definition: ogr.FeatureDefn) -> Dict[str, int]:
+    """Returns a {field_name: field_index} dict for all fields in ``layer_definition``"""
+    return {
+        layer_definition.GetFieldDefn(i).GetName(): i for i in range(layer_definition.GetFieldCount())
+    }
+
+
+def open_gpkg(target: Union[Path, ogr.DataSource], create: bool = False) -> ogr.DataSource:
+    """
+    Opens the Geopackage at ``target`` in update mode. If ``target`` is an already opened data source, it is returned
+    as is. If ``create`` is True, the Geopackage is created if it cannot be opened.
+    """
+    if isinstance(target, ogr.DataSource):
+        return target
+    data_source = ogr.Open(str(target), 1)  # 1 means update mode
+    if data_source is None and create:
+        data_source = ogr.GetDriverByName("GPKG").CreateDataSource(str(target))
+    if data_source is None:
+        raise FileNotFoundError(f"Could not open geopackage: {target}")
+    return data_source
+
+
+@contextmanager
+def transaction(data_source: ogr.DataSource, target: Union[Path, ogr.DataSource]) -> Iterator[None]:
+    """
+    Groups all writes to ``data_source`` in the with-block in a single transaction, which is rolled back on failure.
+    If ``target`` is an already opened data source, the caller owns the transaction and nothing is done here.
+    """
+    if isinstance(target, ogr.DataSource):
+        yield
+        return
+    data_source.StartTransaction()
+    try:
+        yield
+    except Exception:
+        data_source.RollbackTransaction()
+        raise
+    data_source.CommitTransaction()
+
+
+def _execute_scalar(data_source: ogr.DataSource, sql: str):
+    """Executes ``sql`` on ``data_source`` and returns the first value of the first row of the result, if any"""
+    result_set = data_source.ExecuteSQL(sql)
+    if result_set is None:
+        return None
+    try:
+        row = result_set.GetNextFeature()
+        return row.GetField(0) if row is not None else None
+    finally:
+        data_source.ReleaseResultSet(result_set)
+
+
+@contextmanager
+def deferred_spatial_index(data_source: ogr.DataSource, layer_names: List[str]) -> Iterator[None]:
+    """
+    Disables the spatial index of the given Geopackage layers for the duration of the with-block, and rebuilds it in
+    a single pass afterwards. This is much faster than updating the spatial index for each inserted feature.
+    Layers without geometry or without spatial index are left alone.
+    """
+    spatial_indices = []
+    for layer_name in layer_names:
+        layer = data_source.GetLayerByName(layer_name)
+        geometry_column = layer.GetGeometryColumn() if layer is not None else None
+        if geometry_column and _execute_scalar(
+                data_source, f"SELECT HasSpatialIndex('{layer_name}', '{geometry_column}')"
+        ):
+            _execute_scalar(data_source, f"SELECT DisableSpatialIndex('{layer_name}', '{geometry_column}')")
+            spatial_indices.append((layer_name, geometry_column))
+    try:
+        yield
+    finally:
+        for layer_name, geometry_column in spatial_indices:
+            _execute_scalar(data_source, f"SELECT CreateSpatialIndex('{layer_name}', '{geometry_column}')")
+
+
+def open_network_file(network_file: Path) -> Dataset:
+    """
+    Opens a D-FlowFM network file for reading.
+    Masking and scaling are switched off, because the network variables have no fill values or scale factors, so that
+    plain ndarrays are returned instead of masked arrays.
+    """
+    dataset = Dataset(network_file)
+    dataset.set_auto_mask(False)
+    dataset.set_auto_scale(False)
+    return dataset
+
+
+def _network_variables(dataset: Dataset) -> Dict[str, Variable]:
+    """
+    Returns a {lower case variable name: variable} dict.
+    Some files have keys with first letter capitalized, others all lower key
+    """
+    return {key.lower(): variable for key, variable in dataset.variables.items()}
+
+
+def _extract_branches(dataset: Dataset) -> Dict:
+    variables = _network_variables(dataset)
 
     # Extract branch IDs
-    branch_ids = ["".join(b).strip() for b in f.variables[keys['network_branch_id']][:].astype(str)]
-    branch_long_names = ["".join(b).strip() for b in f.variables[keys['network_branch_long_name']][:].astype(str)]
+    branch_ids = _read_strings(variables['network_branch_id'])
+    branch_long_names = _read_strings(variables['network_branch_long_name'])
 
     # Extract branch attributes
-    branch_lengths = f.variables[keys['network_edge_length']][:]
-    branch_orders = f.variables[keys['network_branch_order']][:]
-    branch_types = f.variables[keys['network_branch_type']][:]
+    branch_lengths = variables['network_edge_length'][:]
+    branch_orders = variables['network_branch_order'][:]
+    branch_types = variables['network_branch_type'][:]
 
     # Extract node IDs
-    node_ids = ["".join(n).strip() for n in f.variables[keys['network_node_id']][:].astype(str)]
+    node_ids = _read_strings(variables['network_node_id'])
 
     # Extract geometry node counts per branch
-    geom_node_counts = f.variables[keys['network_geom_node_count']][:]
+    geom_node_counts = variables['network_geom_node_count'][:]
 
     # Extract geometry node coordinates
-    geom_x = f.variables[keys['network_geom_x']][:]
-    geom_y = f.variables[keys['network_geom_y']][:]
+    geom_x = variables['network_geom_x'][:]
+    geom_y = variables['network_geom_y'][:]
 
     # Extract edge-node indices (for start and end nodes)
-    edge_nodes = f.variables[keys['network_edge_nodes']][:]  # (nEdges, 2)
-
-    # List to store branch geometries and their source/target nodes
-    branch_geometries = []
-    source_node_ids = []
-    target_node_ids = []
-
-    current_geom_index = 0  # Keeps track of where to read from Network_geom_x/y
-
-    for i, count in enumerate(geom_node_counts):
-        # Get the X, Y coordinates for the branch
-        branch_x_coords = geom_x[current_geom_index: current_geom_index + count]
-        branch_y_coords = geom_y[current_geom_index: current_geom_index + count]
-
-        # Create LineString geometry
-        line = LineString(zip(branch_x_coords, branch_y_coords))
-        branch_geometries.append(line)
-
-        # Get the source and target node indices
-        source_index, target_index = edge_nodes[i]
-
-        # Get the actual node IDs using these indices
-        source_node_ids.append(node_ids[source_index])
-        target_node_ids.append(node_ids[target_index])
-
-        # Move the index forward by the number of nodes in this branch
-        current_geom_index += count
-
-    layer_dict = dict()
-    for i in range(len(branch_ids)):
-        feature_dict = {
-            "branch_id": branch_ids[i],
-            "branch_long_name": branch_long_names[i],
-            "source_node_id": source_node_ids[i],
-            "target_node_id": target_node_ids[i],
-            "length": branch_lengths[i],
-            "order": branch_orders[i],
-            "type": branch_types[i],
-            "geometry": branch_geometries[i],
+    edge_nodes = variables['network_edge_nodes'][:]  # (nEdges, 2)
+
+    # Split the flat geometry node coordinate arrays into one coordinate array per branch
+    splits = np.cumsum(geom_node_counts)[:-1]
+    branch_geometries = [
+        LineString(np.column_stack((branch_x_coords, branch_y_coords)))
+        for branch_x_coords, branch_y_coords in zip(np.split(geom_x, splits), np.split(geom_y, splits))
+    ]
+
+    # Get the actual source and target node IDs using the edge-node indices
+    node_ids_arr = np.asarray(node_ids)
+    source_node_ids = node_ids_arr[edge_nodes[:, 0]].tolist()
+    target_node_ids = node_ids_arr[edge_nodes[:, 1]].tolist()
+
+    layer_dict = {
+        branch_id: {
+            "branch_id": branch_id,
+            "branch_long_name": branch_long_name,
+            "source_node_id": source_node_id,
+            "target_node_id": target_node_id,
+            "length": length,
+            "order": order,
+            "type": branch_type,
+            "geometry": geometry,
         }
-        layer_dict[branch_ids[i]] = feature_dict
+        for branch_id, branch_long_name, source_node_id, target_node_id, length, order, branch_type, geometry in zip(
+            branch_ids,
+            branch_long_names,
+            source_node_ids,
+            target_node_ids,
+            branch_lengths.tolist(),
+            branch_orders.tolist(),
+            branch_types.tolist(),
+            branch_geometries,
+        )
+    }
+
+    return layer_dict
+
+
+def _extract_nodes(dataset: Dataset) -> Dict:
+    variables = _network_variables(dataset)
+
+    # Extract node IDs (convert from byte strings to normal strings)
+    node_ids = _read_strings(variables['network_node_id'])
+
+    # Extract node coordinates
+    node_x = variables['network_node_x'][:]
+    node_y = variables['network_node_y'][:]
+
+    # (Optional) Extract long names if needed
+    node_long_names = _read_strings(variables['network_node_long_name'])
+
+    node_geometries = shapely.points(node_x, node_y)
+
+    layer_dict = {
+        node_id: {
+            "node_id": node_id,
+            "node_long_name": node_long_name,
+            "geometry": geometry,
+        }
+        for node_id, node_long_name, geometry in zip(node_ids, node_long_names, node_geometries)
+    }
 
     return layer_dict
 
 
+def extract_branches(network_file: Path) -> Dict:
+    """
+    Returns a {branch_id: branch_data} dict, in which branch data is itself a dict with the following keys:
+
+    - branch_id
+    - branch_long_name
+    - source_node_id
+    - target_node_id
+    - length
+    - order
+    - type
+    - geometry
+
+    """
+    return extract_network(network_file)[1]
+
+
 def extract_nodes(network_file: Path) -> Dict:
     """
     Returns a {node_id: node_data} dict, in which node_data is itself a dict with the following keys:
@@ -220,37 +377,31 @@ def extract_nodes(network_file: Path) -> Dict:
     - node_long_name: str
     - geometry: Linestring
     """
-    f = Dataset(network_file)
-    keys = {key.lower(): key for key in f.variables.keys()}  # some files have keys with first letter capitalized,
-                                                             # others all lower key
+    return extract_network(network_file)[0]
 
-    # Extract node IDs (convert from byte strings to normal strings)
-    node_ids = ["".join(n).strip() for n in f.variables[keys['network_node_id']][:].astype(str)]
 
-    # Extract node coordinates
-    node_x = f.variables[keys['network_node_x']][:]
-    node_y = f.variables[keys['network_node_y']][:]
-
-    # (Optional) Extract long names if needed
-    node_long_names = ["".join(n).strip() for n in f.variables[keys['network_node_long_name']][:].astype(str)]
+@lru_cache(maxsize=None)
+def _read_network(network_file: Path, modified: int) -> Tuple[Dict, Dict]:
+    """Cached backend of ``extract_network()``. ``modified`` is only used as part of the cache key"""
+    with open_network_file(network_file) as dataset:
+        return _extract_nodes(dataset), _extract_branches(dataset)
 
-    node_geometries = [Point(x, y) for x, y in zip(node_x, node_y)]
 
-    layer_dict = dict()
-    for i in range(len(node_ids)):
-        feature_dict = {
-            "node_id": node_ids[i],
-            "node_long_name": node_long_names[i],
-            "geometry": node_geometries[i],
-        }
-        layer_dict[node_ids[i]] = feature_dict
+def extract_network(network_file: Path) -> Tuple[Dict, Dict]:
+    """
+    Returns the nodes and branches in the network file, opening the file only once.
+    See ``extract_nodes()`` and ``extract_branches()`` for the structure of the returned dicts.
 
-    return layer_dict
+    The network file is read only once, also if it is extracted multiple times, unless it has been modified in the
+    meantime. The returned dicts are shared between callers, so they must not be modified.
+    """
+    network_file = Path(network_file)
+    return _read_network(network_file, network_file.stat().st_mtime_ns)
 
 
 def import_to_threedi_layer(
         source: Dict,
-        target: Path,
+        target: Union[Path, ogr.DataSource],
         layer_mapping: LayerMapping,
         input_name_id_mapping: Dict = None
 ) -> Dict:
@@ -258,16 +409,14 @@ def import_to_threedi_layer(
     Import schematisation objects from a source dict that was extracted using extract_from_ini()
 
     :param source: Path to the source shapefile
-    :param target: Path to the target 3Di schematisation Geopackage
+    :param target: Path to the target 3Di schematisation Geopackage, or the already opened Geopackage
     :param layer_mapping: LayerMapping object that contains the data needed to map source data to target data.
     :param input_name_id_mapping: Mapping of D-Hydro "Name" to 3Di "ID" in a {name: id} dict. For example, if importing
     channels, input_name_id_mapping should be a {<Node name>:<connection node id>} dict
     :returns: Mapping of D-Hydro "Name" to 3Di "ID" in a {name: id} dict
     """
 
-    gpkg = ogr.Open(str(target), 1)  # 1 means update mode
-    if gpkg is None:
-        raise FileNotFoundError(f"Could not open geopackage: {target}")
+    gpkg = open_gpkg(target)
     dst_layer = gpkg.GetLayerByName(layer_mapping.target_layer_name)
     if dst_layer is None:
         raise Exception(f"Layer '{layer_mapping.target_layer_name}' not found in {target}")
@@ -275,43 +424,54 @@ def import_to_threedi_layer(
     dst_layer_def = dst_layer.GetLayerDefn()
 
     # Calculate the maximum current value for 'id' in the destination layer
-    max_id = 0
-    dst_layer.ResetReading()  # Ensure we read from the beginning of the layer
-    for feat in dst_layer:
-        current_id = feat.GetFID()
-        if current_id is not None and current_id > max_id:
-            max_id = current_id
+    max_id_result = gpkg.ExecuteSQL(
+        f'SELECT MAX("{dst_layer.GetFIDColumn()}") AS max_id FROM "{layer_mapping.target_layer_name}"'
+    )
+    max_id = max_id_result.GetNextFeature().GetField("max_id") or 0
+    gpkg.ReleaseResultSet(max_id_result)
 
     # Set the starting value for auto-increment
     next_id = max_id + 1
 
     output_name_id_mapping = dict()
 
-    for src_feat_name, src_feat in source.items():
-        dst_feat = ogr.Feature(dst_layer_def)
-        new_geom = ogr.CreateGeometryFromWkb(src_feat["geometry"].wkb)
-        new_geom.FlattenTo2D()
-        dst_feat.SetGeometry(new_geom)
-
-        # Set the target primary key "id" with the next auto-increment value
-        dst_feat.SetFID(next_id)
-
-        for source_field, target_field in layer_mapping.field_mapping.items():
-            source_value = src_feat[source_field]
-            if isinstance(target_field, Proxy):
-                if input_name_id_mapping is None:
-                    raise Exception("input_name_id_mapping needed but not provided")
-                source_value = input_name_id_mapping[source_value]
-            dst_feat.SetField(target_field, source_value)
-
-        # Add the new feature to the destination layer
-        dst_layer.CreateFeature(dst_feat)
-
-        # Clean up
-        dst_feat = None
-
-        output_name_id_mapping[src_feat_name] = next_id
-        next_id += 1
+    # (source field, target field index, whether the value must be mapped with input_name_id_mapping), determined once
+    # instead of for each feature
+    field_mapping = [
+        (source_field, dst_layer_def.GetFieldIndex(target_field), isinstance(target_field, Proxy))
+        for source_field, target_field in layer_mapping.field_mapping.items()
+    ]
+    if input_name_id_mapping is None and any(is_proxy for _, _, is_proxy in field_mapping):
+        raise Exception("input_name_id_mapping needed but not provided")
+    create_feature = dst_layer.CreateFeature
+
+    with (
+        transaction(gpkg, target),  # one transaction for all features instead of an implicit commit per feature
+        # inside the transaction, so that a rollback also restores the spatial index
+        deferred_spatial_index(gpkg, [layer_mapping.target_layer_name]),
+    ):
+        for (src_feat_name, src_feat), wkb in zip(source.items(), geometries_to_wkb(source)):
+            dst_feat = ogr.Feature(dst_layer_def)
+            dst_feat.SetGeometryDirectly(ogr.CreateGeometryFromWkb(wkb))
+
+            # Set the target primary key "id" with the next auto-increment value
+            dst_feat.SetFID(next_id)
+
+            set_field = dst_feat.SetField
+            for source_field, target_field_index, is_proxy in field_mapping:
+                source_value = src_feat[source_field]
+                if is_proxy:
+                    source_value = input_name_id_mapping[source_value]
+                set_field(target_field_index, source_value)
+
+            # Add the new feature to the destination layer
+            create_feature(dst_feat)
+
+            # Clean up
+            dst_feat = None
+
+            output_name_id_mapping[src_feat_name] = next_id
+            next_id += 1
 
     # Cleanup and close datasets
     src_ds = None
@@ -322,7 +482,7 @@ def import_to_threedi_layer(
 def import_structures(
         source: Dict,
         epsg_code: int,
-        target: Path,
+        target: Union[Path, ogr.DataSource],
         cross_section_data: Dict[str, ThreeDiCrossSectionData],
         field_definitions: List[ogr.FieldDefn],
         feature_type: str = "unknown",
@@ -336,12 +496,7 @@ def import_structures(
     target_layer_name = target_layer_name or "dhydro_" + feature_type
 
     # Open or create the GeoPackage
-    driver = ogr.GetDriverByName("GPKG")
-    gpkg = driver.Open(target, 1)  # 1 = Read/Write mode
-
-    if gpkg is None:
-        # If the GeoPackage doesn't exist, create it
-        gpkg = driver.CreateDataSource(target)
+    gpkg = open_gpkg(target, create=True)
 
     # Check if the layer already exists and remove it
     if gpkg.GetLayerByName(target_layer_name):
@@ -362,71 +517,70 @@ def import_structures(
         gpkg_layer.CreateField(field_defn)
 
     # Add additional fields to the GeoPackage layer: cross-section
-    for field_name, field_type in (ThreeDiCrossSectionData.fields | ThreeDiFrictionData.fields).items():
+    for field_name, field_type in CROSS_SECTION_AND_FRICTION_FIELDS.items():
         ogr_field_type = OGR_FIELD_TYPES[field_type]
         field_defn = ogr.FieldDefn(field_name, ogr_field_type)
         gpkg_layer.CreateField(field_defn)
 
     # Create features from source
     dst_layer_defn: ogr.FeatureDefn = gpkg_layer.GetLayerDefn()
-    for src_feat_name, src_feat in source.items():
-        dst_feat = ogr.Feature(dst_layer_defn)
-        new_geom = ogr.CreateGeometryFromWkb(src_feat["geometry"].wkb)
-        new_geom.FlattenTo2D()
-        dst_feat.SetGeometry(new_geom)
-
-        for attr, value in src_feat.items():
-            if attr != "geometry":
-                field_index = dst_layer_defn.GetFieldIndex(attr)
-                dst_feat.SetField(field_index, value)
-
-        # data from cross-section definitions
-        src_feat_id = src_feat["id"]
-
-        if src_feat_id in cross_section_data:
-            cross_section_definition = cross_section_data[src_feat_id]
-            if feature_type == 'culvert':
-                cross_section_definition.friction_data = GenericFrictionDefinition(
-                    friction_type=src_feat["bedfrictiontype"],
-                    friction_value=src_feat["bedfriction"],
-                ).to_threedi()
-            elif feature_type == 'bridge':
-                cross_section_definition.friction_data = GenericFrictionDefinition(
-                    friction_type=src_feat["frictiontype"],
-                    friction_value=src_feat["friction"],
-                ).to_threedi()
-                cross_section_definition.shift_down(src_feat["shift"])
-                cross_section_definition.reference_level = src_feat["shift"]
-            add_cross_section_data_to_feature(
-                cross_section_definition=cross_section_definition,
-                feature=dst_feat,
-                feature_type=feature_type,
-            )
+    field_indices = get_field_indices(dst_layer_defn)
+    with transaction(gpkg, target):
+        for (src_feat_name, src_feat), wkb in zip(source.items(), geometries_to_wkb(source)):
+            dst_feat = ogr.Feature(dst_layer_defn)
+            dst_feat.SetGeometryDirectly(ogr.CreateGeometryFromWkb(wkb))
+
+            for attr, value in src_feat.items():
+                if attr != "geometry":
+                    dst_feat.SetField(field_indices[attr], value)
+
+            # data from cross-section definitions
+            src_feat_id = src_feat["id"]
+
+            if src_feat_id in cross_section_data:
+                cross_section_definition = cross_section_data[src_feat_id]
+                if feature_type == 'culvert':
+                    cross_section_definition.friction_data = GenericFrictionDefinition(
+                        friction_type=src_feat["bedfrictiontype"],
+                        friction_value=src_feat["bedfriction"],
+                    ).to_threedi()
+                elif feature_type == 'bridge':
+                    cross_section_definition.friction_data = GenericFrictionDefinition(
+                        friction_type=src_feat["frictiontype"],
+                        friction_value=src_feat["friction"],
+                    ).to_threedi()
+                    cross_section_definition.shift_down(src_feat["shift"])
+                    cross_section_definition.reference_level = src_feat["shift"]
+                add_cross_section_data_to_feature(
+                    cross_section_definition=cross_section_definition,
+                    feature=dst_feat,
+                    feature_type=feature_type,
+                )
 
-        if feature_type == 'universalweir':
-            y_values = [float(val) for val in src_feat["yvalues"].split(",")]
-            z_values = list(
-                np.round(
-                    np.array([float(val) for val in src_feat["zvalues"].split(",")]) - src_feat["crestlevel"],
-                    4
+            if feature_type == 'universalweir':
+                y_values = [float(val) for val in src_feat["yvalues"].split(",")]
+                z_values = list(
+                    np.round(
+                        np.array([float(val) for val in src_feat["zvalues"].split(",")]) - src_feat["crestlevel"],
+                        4
+                    )
                 )
-            )
 
-            dst_feat.SetField("cross_section_shape", CrossSectionShape.YZ.value)
-            dst_feat.SetField("cross_section_table", lists_to_csv([y_values, z_values]))
+                dst_feat.SetField("cross_section_shape", CrossSectionShape.YZ.value)
+                dst_feat.SetField("cross_section_table", lists_to_csv([y_values, z_values]))
+
+            gpkg_layer.CreateFeature(dst_feat)
+            dst_feat = None  # Free memory
 
-        gpkg_layer.CreateFeature(dst_feat)
-        dst_feat = None  # Free memory
+    print(f"Successfully copied {feature_type}s to '{gpkg.GetName()}' as layer '{target_layer_name}'.")
 
     # Cleanup
     gpkg = None
 
-    print(f"Successfully copied {feature_type}s to '{target}' as layer '{target_layer_name}'.")
-
 
 def import_table(
         source: Dict,
-        target: Path,
+        target: Union[Path, ogr.DataSource],
         field_definitions: List[ogr.FieldDefn],
         feature_type: str = "unknown",
         target_layer_name: str = None,
@@ -442,12 +596,7 @@ def import_table(
     use_geometry = features_have_geometry(source)
 
     # Open or create the GeoPackage
-    driver = ogr.GetDriverByName("GPKG")
-    gpkg = driver.Open(target, 1)  # 1 = Read/Write mode
-
-    if gpkg is None:
-        # If the GeoPackage doesn't exist, create it
-        gpkg = driver.CreateDataSource(target)
+    gpkg = open_gpkg(target, create=True)
 
     # Check if the layer already exists and remove it
     existing_layer = gpkg.GetLayerByName(target_layer_name)
@@ -479,26 +628,26 @@ def import_table(
 
     # Create features from source
     dst_layer_defn: ogr.FeatureDefn = gpkg_layer.GetLayerDefn()
-    for src_feat_name, src_feat in source.items():
-        dst_feat = ogr.Feature(dst_layer_defn)
-        if use_geometry:
-            new_geom = ogr.CreateGeometryFromWkb(src_feat["geometry"].wkb)
-            new_geom.FlattenTo2D()
-            dst_feat.SetGeometry(new_geom)
+    field_indices = get_field_indices(dst_layer_defn)
+    with transaction(gpkg, target):
+        wkbs = geometries_to_wkb(source) if use_geometry else [None] * len(source)
+        for (src_feat_name, src_feat), wkb in zip(source.items(), wkbs):
+            dst_feat = ogr.Feature(dst_layer_defn)
+            if use_geometry:
+                dst_feat.SetGeometryDirectly(ogr.CreateGeometryFromWkb(wkb))
 
-        for attr, value in src_feat.items():
-            if attr != "geometry":
-                field_index = dst_layer_defn.GetFieldIndex(attr)
-                dst_feat.SetField(field_index, value)
+            for attr, value in src_feat.items():
+                if attr != "geometry":
+                    dst_feat.SetField(field_indices[attr], value)
 
-        gpkg_layer.CreateFeature(dst_feat)
-        dst_feat = None  # Free memory
+            gpkg_layer.CreateFeature(dst_feat)
+            dst_feat = None  # Free memory
+
+    print(f"Successfully copied {feature_type}s to '{gpkg.GetName()}' as layer '{target_layer_name}'.")
 
     # Cleanup
     gpkg = None
 
-    print(f"Successfully copied {feature_type}s to '{target}' as layer '{target_layer_name}'.")
-
 
 def get_cross_section_location_id_to_defname_mapping(
         name_id_mapping: Dict,
@@ -508,15 +657,29 @@ def get_cross_section_location_id_to_defname_mapping(
     Returns a {cross_section_location.id: DefName} mapping that can be used to connect cross-section data to
     imported cross-section locations.
     """
-    name_defname_dict = {
-        name: data["definitionid"]
-        for name, data in cross_section_locations.items()
-    }
-
-    result = {
-        id: name_defname_dict[name]
+    return {
+        id: cross_section_locations[name]["definitionid"]
         for name, id in name_id_mapping.items()
     }
+
+
+def cross_section_field_values(cross_section_definition: ThreeDiCrossSectionData) -> Dict:
+    """
+    Returns the {field name: value} dict of the non-empty values from ``cross_section_definition`` and, if it is
+    valid, ``cross_section_definition.friction_data``
+    """
+    attributes = [(cross_section_definition, attribute) for attribute in ThreeDiCrossSectionData.fields.keys()]
+    if cross_section_definition.friction_data.is_valid:
+        attributes += [
+            (cross_section_definition.friction_data, attribute) for attribute in ThreeDiFrictionData.fields.keys()
+        ]
+    result = dict()
+    for obj, attribute in attributes:
+        value = getattr(obj, attribute)
+        if isinstance(value, Enum):
+            value = value.value
+        if value is not None:
+            result[attribute] = value
     return result
 
 
@@ -524,27 +687,21 @@ def add_cross_section_data_to_feature(
         cross_section_definition: ThreeDiCrossSectionData,
         feature: ogr.Feature,
         feature_type: str,
+        field_values: Dict = None,
 ) -> None:
     """
     Adds values from ``cross_section_definition`` and ``cross_section_definition.friction_data`` to ``feature``
     :param cross_section_definition:
     :param feature:
+    :param field_values: output of ``cross_section_field_values(cross_section_definition)``, if already known
     :return:
     """
-    for attribute in ThreeDiCrossSectionData.fields.keys():
-        new_value = getattr(cross_section_definition, attribute)
-        if isinstance(new_value, Enum):
-            new_value = new_value.value
-        if feature[attribute] is None and new_value is not None:
+    if field_values is None:
+        field_values = cross_section_field_values(cross_section_definition)
+    for attribute, new_value in field_values.items():
+        if feature[attribute] is None:
             feature.SetField(attribute, new_value)
-    if cross_section_definition.friction_data.is_valid:
-        for attribute in ThreeDiFrictionData.fields.keys():
-            new_value = getattr(cross_section_definition.friction_data, attribute)
-            if isinstance(new_value, Enum):
-                new_value = new_value.value
-            if feature[attribute] is None and new_value is not None:
-                feature.SetField(attribute, new_value)
-    else:
+    if not cross_section_definition.friction_data.is_valid:
         warnings.warn(
             f"Friction data for {feature_type} with ID {feature.GetFID()} is not valid. "
             f"Reason: {cross_section_definition.friction_data.invalid_reason}"
@@ -553,16 +710,22 @@ def add_cross_section_data_to_feature(
 
 def enrich_cross_section_locations(
         cross_section_data: Dict[str, ThreeDiCrossSectionData],
-        gpkg: Path,
+        gpkg: Union[Path, ogr.DataSource],
         cross_section_id_to_defname_mapping: Dict = None
 ):
     # Open the GeoPackage
-    data_source = ogr.Open(gpkg, 1)  # 1 means update mode
+    data_source = open_gpkg(gpkg)
+    layer = data_source.GetLayer("cross_section_location")
+
+    # Many cross-section locations share a cross-section definition, so the field values are collected once per
+    # cross-section definition instead of once per feature
+    field_values = {
+        def_name: cross_section_field_values(cross_section_data[def_name])
+        for def_name in set((cross_section_id_to_defname_mapping or {}).values())
+        if def_name in cross_section_data
+    }
 
-    if data_source is None:
-        raise FileNotFoundError(f"Could not open geopackage: {gpkg}")
-    else:
-        layer = data_source.GetLayer("cross_section_location")
+    with transaction(data_source, gpkg):
         for feature in layer:
             cross_section_location_id = feature.GetFID()
             try:
@@ -573,59 +736,85 @@ def enrich_cross_section_locations(
 
             if not cross_section_definition.is_valid:
                 warnings.warn(
-                    f"cross_section_location with id {cross_section_location_id} has an invalid cross_section"
+                    f"cross_section_location with id {cross_section_location_id} has an invalid cross_section, "
+                    f"its cross-section data is not added"
                 )
+                continue
 
             add_cross_section_data_to_feature(
                 cross_section_definition=cross_section_definition,
                 feature=feature,
                 feature_type="cross_section_location",
+                field_values=field_values[def_name],
             )
 
             layer.SetFeature(feature)
-        data_source = None  # Close the data source
+    data_source = None  # Close the data source
 
 
-def enrich_cross_section_definition(
-        cross_section_definition: ThreeDiCrossSectionData,
-        cross_section_locations: Dict[str, Dict],
+def index_cross_section_locations(cross_section_locations: Dict[str, Dict]) -> Dict[str, Dict]:
+    """
+    Returns a {definitionid: cross_section_location} dict. If multiple cross-section locations have the same
+    cross-section definition, the first one is used.
+    """
+    result = dict()
+    for cross_section_location in cross_section_locations.values():
+        result.setdefault(cross_section_location["definitionid"], cross_section_location)
+    return result
+
+
+def index_branch_friction_definitions(
         branch_friction_definitions: Dict[str, List[BranchFrictionDefinition]]
-) -> ThreeDiCrossSectionData:
+) -> Dict[Tuple[str, float], BranchFrictionDefinition]:
     """
-    Find branch friction data for given cross-section definition and update it accordingly
-    If no branch friction data is found, cross-section definition is returned unaltered.
+    Returns a {(branch_id, chainage): BranchFrictionDefinition} dict, with chainages rounded to 2 decimals. If a branch
+    has multiple friction definitions at the same (rounded) chainage, the last one is used.
     """
+    return {
+        (branch_id, round(friction_definition.chainage, 2)): friction_definition
+        for branch_id, friction_definitions in branch_friction_definitions.items()
+        for friction_definition in friction_definitions
+    }
 
-    # Find cross-section location that has this cross-section definition
-    found_xsec_loc = False
-    for cross_section_location in cross_section_locations.values():
-        if cross_section_location["definitionid"] == cross_section_definition.code:
-            found_xsec_loc = True
-            break
-    if not found_xsec_loc:
-        return cross_section_definition
 
-    try:
-        if cross_section_location["branchid"] == "W4890":
-            a = branch_friction_definitions[cross_section_location["branchid"]]
-    except KeyError:
-        pass
+def enrich_cross_section_definitions(
+        cross_section_definitions: Iterable[ThreeDiCrossSectionData],
+        cross_section_locations_by_definition: Dict[str, Dict],
+        branch_friction_index: Dict[Tuple[str, float], BranchFrictionDefinition]
+):
+    """
+    Find branch friction data for given cross-section definitions and update them (in place) accordingly
+    Cross-section definitions for which no branch friction data is found are left unaltered.
+    The friction data of all matched branch friction definitions is converted to 3Di in one batch. Friction values
+    that cannot be converted (e.g. 0 or negative) fail in the same way as ``BranchFrictionDefinition.to_threedi()``.
 
-    # Find the branch friction definition for this cross-section location
-    try:
-        friction_definitions = branch_friction_definitions[cross_section_location["branchid"]]
-    except KeyError:
-        return cross_section_definition
-    for friction_definition in friction_definitions:
-        if round(friction_definition.chainage, 2) == round(cross_section_location["chainage"], 2):
-            # Update the cross-section definition with friction data from the BranchFrictionDefinition
-            cross_section_definition.friction_data = friction_definition.to_threedi()
+    :param cross_section_locations_by_definition: output of ``index_cross_section_locations()``
+    :param branch_friction_index: output of ``index_branch_friction_definitions()``
+    """
+    matches = list()  # [(cross-section definition, branch friction definition)]
+    for cross_section_definition in cross_section_definitions:
+        # Find cross-section location that has this cross-section definition
+        cross_section_location = cross_section_locations_by_definition.get(cross_section_definition.code)
+        if cross_section_location is None:
+            continue
+
+        # Find the branch friction definition for this cross-section location
+        branch_friction_definition = branch_friction_index.get(
+            (cross_section_location["branchid"], round(cross_section_location["chainage"], 2))
+        )
+        if branch_friction_definition is not None:
+            matches.append((cross_section_definition, branch_friction_definition))
 
-    return cross_section_definition
+    # Update the cross-section definitions with friction data from the BranchFrictionDefinitions
+    friction_data = friction_definitions_to_threedi(
+        [branch_friction_definition for _, branch_friction_definition in matches]
+    )
+    for (cross_section_definition, _), cross_section_friction_data in zip(matches, friction_data):
+        cross_section_definition.friction_data = cross_section_friction_data
 
 
 def replace_structures(
-        gpkg: Path,
+        gpkg: Union[Path, ogr.DataSource],
         source: Dict,
         delete_from_layer: str,
         add_to_layer: str,
@@ -646,10 +835,7 @@ def replace_structures(
     The source_feature dict contains a key for each attribute and a "geometry" key for the (Shapely) geometry
     """
     # Open the GeoPackage
-    data_source = ogr.Open(str(gpkg), 1)  # Open in update mode
-
-    if data_source is None:
-        raise RuntimeError(f"Failed to open {gpkg}")
+    data_source = open_gpkg(gpkg)
 
     # Open the layers
     delete_layer = data_source.GetLayerByName(delete_from_layer)
@@ -662,27 +848,53 @@ def replace_structures(
     add_layer_field_definitions = [
         add_layer_layer_definition.GetFieldDefn(i) for i in range(add_layer_layer_definition.GetFieldCount())
     ]
-    delete_fids = []
+    # Index the features in the delete layer by match value once, instead of filtering the layer for each code
+    delete_features = dict()
+    for feature in delete_layer:
+        delete_features.setdefault(feature.GetField(match_field), feature.Clone())
+
+    # Match the source features to the features in the delete layer
+    matches = [
+        (delete_features[match_value], feature_data)
+        for code, feature_data in source.items()
+        if (match_value := f"{match_prefix}{code}{match_postfix}") in delete_features
+    ]
+    delete_fids = [delete_feature.GetFID() for delete_feature, _ in matches]
+
+    # Collect the new attribute values column by column, so that each field config is evaluated once per field instead
+    # of once per feature and field
+    def get_column(replacement_config: ReplacementConfig) -> List:
+        if replacement_config.get_from == "source":
+            column = [feature_data[replacement_config.source_field] for _, feature_data in matches]
+        elif replacement_config.get_from == "delete_layer":
+            column = [delete_feature.GetField(replacement_config.source_field) for delete_feature, _ in matches]
+        if replacement_config.parser:
+            column = [replacement_config.parser(value) for value in column]
+        return column
+
+    geometry_config = config["geometry"]
+    if geometry_config.get_from == "source":
+        geometries = [
+            ogr.CreateGeometryFromWkb(wkb) for wkb in shapely.to_wkb(
+                np.array([feature_data["geometry"] for _, feature_data in matches], dtype=object),
+                output_dimension=2
+            )
+        ]
+    elif geometry_config.get_from == "delete_layer":
+        geometries = [delete_feature.GetGeometryRef().Clone() for delete_feature, _ in matches]
+    if geometry_config.parser:
+        geometries = [geometry_config.parser(geom) for geom in geometries]
+    columns = {
+        i: get_column(config[field_defn.name]) for i, field_defn in enumerate(add_layer_field_definitions)
+    }
+
     results = []
-    for code, feature_data in source.items():
-        delete_layer.SetAttributeFilter(f"{match_field} = '{match_prefix}{code}{match_postfix}'")
-        delete_feature = delete_layer.GetNextFeature()
-        if delete_feature:
-            delete_fids.append(delete_feature.GetFID())
+    with transaction(data_source, gpkg):  # insert the new features and delete the old ones in a single transaction
+        for row, (delete_feature, feature_data) in enumerate(matches):
             new_feature = ogr.Feature(add_layer_layer_definition)
-            if config["geometry"].get_from == "source":
-                geom = ogr.CreateGeometryFromWkb(feature_data["geometry"].wkb)
-            elif config["geometry"].get_from == "delete_layer":
-                geom = delete_feature.GetGeometryRef().Clone()
-            geom = config["geometry"].parser(geom)
-            new_feature.SetGeometry(geom)
-            for field_defn in add_layer_field_definitions:
-                field_config = config[field_defn.name]
-                if field_config.get_from == "source":
-                    value = field_config.parser(feature_data[field_config.source_field])
-                elif field_config.get_from == "delete_layer":
-                    value = field_config.parser(delete_feature.GetField(field_config.source_field))
-                new_feature.SetField(field_defn.name, value)
+            new_feature.SetGeometryDirectly(geometries[row])  # new geometry, so the feature can take ownership
+            for i, column in columns.items():
+                new_feature.SetField(i, column[row])
 
             add_layer.CreateFeature(new_feature)
             results.append((
@@ -692,24 +904,22 @@ def replace_structures(
             ))
             new_feature = None  # Dereference feature
 
-        delete_layer.SetAttributeFilter(None)  # Reset the filter
-
-    for fid in delete_fids:
-        delete_layer.DeleteFeature(fid)
+        if delete_fids:
+            data_source.ExecuteSQL(
+                f'DELETE FROM "{delete_from_layer}" '
+                f'WHERE "{delete_layer.GetFIDColumn()}" IN ({",".join(map(str, delete_fids))})'
+            )
 
     return results
 
 
-def map_pumps(gpkg: Path, replacement_data: List[Tuple]):
+def map_pumps(gpkg: Union[Path, ogr.DataSource], replacement_data: List[Tuple]):
     """
     ``replacement_data`` is what is returned from ``replace_structures``.
     ``orientation`` must be one of "positive", "negative"
     """
     # Open the GeoPackage
-    data_source = ogr.Open(str(gpkg), 1)  # Open in update mode
-
-    if data_source is None:
-        raise RuntimeError(f"Failed to open {gpkg}")
+    data_source = open_gpkg(gpkg)
 
     target_layer_name = "pump_map"
     target_layer = data_source.GetLayerByName(target_layer_name)
@@ -719,30 +929,40 @@ def map_pumps(gpkg: Path, replacement_data: List[Tuple]):
 
     layer_definition = target_layer.GetLayerDefn()
 
-    for deleted_feature, source_feature, pump_feature in replacement_data:
-        orientation = source_feature["orientation"]
-        new_feature = ogr.Feature(layer_definition)
-        geom = deleted_feature.GetGeometryRef().Clone()
-        if orientation == "negative":
-            geom = reverse_line(geom)
+    # Everything that does not depend on the feature is looked up once, outside the loop
+    pump_id_index = layer_definition.GetFieldIndex("pump_id")
+    start_index = layer_definition.GetFieldIndex("connection_node_id_start")
+    end_index = layer_definition.GetFieldIndex("connection_node_id_end")
+    create_feature = target_layer.CreateFeature
 
-        new_feature.SetGeometry(geom)
+    # {orientation: (proxy-orifice field that holds the pump map start node, idem for the end node, reverse geometry)}
+    orientation_config = {
+        "positive": ("connection_node_id_start", "connection_node_id_end", False),
+        "negative": ("connection_node_id_end", "connection_node_id_start", True),
+    }
+
+    with transaction(data_source, gpkg):  # one transaction for all features instead of an implicit commit per feature
+        for deleted_feature, source_feature, pump_feature in replacement_data:
+            start, end, reverse = orientation_config[source_feature["orientation"]]
+            new_feature = ogr.Feature(layer_definition)
 
-        # attributes from pump feature
-        new_feature.SetFID(pump_feature.GetFID())
-        new_feature.SetField("code", pump_feature.GetField("code"))
-        new_feature.SetField("display_name", pump_feature.GetField("display_name"))
-        new_feature.SetField("pump_id", pump_feature.GetFID())
-        new_feature.SetField("tags", pump_feature.GetField("tags"))
+            # attributes from pump feature (code, display_name, tags), copied by field name in a single call
+            new_feature.SetFrom(pump_feature, forgiving=1)
+            pump_id = pump_feature.GetFID()
+            new_feature.SetFID(pump_id)
+            new_feature.SetField(pump_id_index, pump_id)
 
+            geom = deleted_feature.GetGeometryRef().Clone()
+            if reverse:
+                geom = reverse_line(geom)
 
-        # attributes from proxy-orifice feature
-        start = "connection_node_id_start" if orientation == "positive" else "connection_node_id_end"
-        end = "connection_node_id_end" if orientation == "positive" else "connection_node_id_start"
-        new_feature.SetField("connection_node_id_start", deleted_feature.GetField(start))
-        new_feature.SetField("connection_node_id_end", deleted_feature.GetField(end))
+            new_feature.SetGeometryDirectly(geom)  # geom is a new geometry, so the feature can take ownership
 
-        target_layer.CreateFeature(new_feature)
+            # attributes from proxy-orifice feature
+            new_feature.SetField(start_index, deleted_feature.GetField(start))
+            new_feature.SetField(end_index, deleted_feature.GetField(end))
+
+            create_feature(new_feature)
 
 
 def clear_gpkg(gpkg: Path, layers_to_clear: List[str]):
@@ -750,28 +970,25 @@ def clear_gpkg(gpkg: Path, layers_to_clear: List[str]):
     if data_source is None:
         raise FileNotFoundError(f"Could not open geopackage: {gpkg}")
     else:
+        data_source.StartTransaction()  # Start a transaction for efficiency
         for layer_name in layers_to_clear:
             layer = data_source.GetLayerByName(layer_name)
             if layer is None:
                 print(f"Layer '{layer_name}' not found, skipping...")
                 continue
 
-            # Delete all features in the layer
-            layer.StartTransaction()  # Start a transaction for efficiency
-
-            for feature in layer:
-                layer.DeleteFeature(feature.GetFID())
-
-            layer.CommitTransaction()  # Commit changes
+            # Delete all features in the layer in a single statement
+            data_source.ExecuteSQL(f'DELETE FROM "{layer_name}"')
 
             print(f"Cleared all features from '{layer_name}'.")
+        data_source.CommitTransaction()  # Commit changes
 
         # Cleanup
         data_source = None
 
 
-def dflowfm2threedi(
-        target_gpkg: Path,
+def _dflowfm2threedi(
+        gpkg: ogr.DataSource,
         mdu_path: Path,
         network_file_path: Path,
         cross_section_locations_path: Path,
@@ -780,21 +997,25 @@ def dflowfm2threedi(
         skip_branches: bool = False,
 ):
     if not skip_branches:
-        print("Extracting nodes...")
-        nodes = extract_nodes(network_file=network_file_path)
+        print("Extracting nodes and branches...")
+        nodes, branches = extract_network(network_file=network_file_path)
         print("Importing connection nodes...")
         connection_node_name_id_mapping = import_to_threedi_layer(
             source=nodes,
-            target=target_gpkg,
+            target=gpkg,
             layer_mapping=connection_node_layer_mapping
         )
-    print("Extracting branches...")
-    branches = extract_branches(network_file=network_file_path)
+    else:
+        # Branches are still needed to construct the geometries of branch friction definitions and structures from
+        # their branchid and chainage. extract_branches() is cached, so this does not re-read the network file if it
+        # has been read already
+        print("Extracting branches...")
+        branches = extract_branches(network_file=network_file_path)
     if not skip_branches:
         print("Importing channels...")
         channel_name_id_mapping = import_to_threedi_layer(
             source=branches,
-            target=target_gpkg,
+            target=gpkg,
             layer_mapping=channel_layer_mapping,
             input_name_id_mapping=connection_node_name_id_mapping
         )
@@ -807,31 +1028,27 @@ def dflowfm2threedi(
         print("Importing cross-section locations...")
         cross_section_id_mapping = import_to_threedi_layer(
             source=cross_section_locations,
-            target=target_gpkg,
+            target=gpkg,
             layer_mapping=cross_section_location_mapping,
             input_name_id_mapping=channel_name_id_mapping,
         )
     # Friction definitions
     print("Attempting to parse raw friction definitions")
-    mdu = configparser.ConfigParser()
-    mdu.read(mdu_path)
-    frict_files = mdu["geometry"]["FrictFile"].split(";")
     overwrite = {FrictGlobal: True, FrictBranch: True}  # overwrite on first write only
-    for frict_file in frict_files:
-        friction_path = mdu_path.parent / frict_file
+    for friction_path in friction_files(mdu_path):
         for friction_type in [FrictGlobal, FrictBranch]:
             friction_entries, friction_fielddefn = extract_from_ini(
                 friction_path,
                 object_type=friction_type,
                 branches=branches
             )
-            print(f"extracted {len(friction_entries)} {friction_type.__name__.lower()} definitions")
+            print(f"extracted {len(friction_entries)} {FEATURE_TYPE_NAMES[friction_type]} definitions")
             if len(friction_entries) > 0:
                 import_table(
                     source=friction_entries,
-                    target=target_gpkg,
+                    target=gpkg,
                     field_definitions=friction_fielddefn,
-                    feature_type=friction_type.__name__.lower(),
+                    feature_type=FEATURE_TYPE_NAMES[friction_type],
                     epsg_code=28992,
                     overwrite=overwrite[friction_type]
                 )
@@ -849,30 +1066,29 @@ def dflowfm2threedi(
 
     # Also export raw cross-section data to geopackage, for reference/checking purposes
     for cross_section_type in SUPPORTED_CROSS_SECTIONS:
-        print(f"Extracting {cross_section_type.__name__.lower()}s...")
+        print(f"Extracting {FEATURE_TYPE_NAMES[cross_section_type]}s...")
         cross_section_definitions_raw, cross_def_field_definitions = extract_from_ini(
             ini_file=cross_def_path,
             object_type=cross_section_type
         )
-        print(f"Importing {cross_section_type.__name__.lower()}s...")
+        print(f"Importing {FEATURE_TYPE_NAMES[cross_section_type]}s...")
         import_table(
             source=cross_section_definitions_raw,
-            target=target_gpkg,
+            target=gpkg,
             field_definitions=cross_def_field_definitions,
-            feature_type=cross_section_type.__name__.lower()
+            feature_type=FEATURE_TYPE_NAMES[cross_section_type]
         )
 
     if not skip_branches:
         # enrich cross_section_definitions with branch friction data
         print("Adding branch friction data to cross-section definitions...")
-        cross_section_definitions = {
-            id: enrich_cross_section_definition(
-                cross_section_definition,
-                cross_section_locations,
-                branch_friction_definitions,
-            )
-            for id, cross_section_definition in cross_section_definitions.items()
-        }
+        cross_section_locations_by_definition = index_cross_section_locations(cross_section_locations)
+        branch_friction_index = index_branch_friction_definitions(branch_friction_definitions)
+        enrich_cross_section_definitions(
+            cross_section_definitions.values(),
+            cross_section_locations_by_definition,
+            branch_friction_index,
+        )
 
         cross_section_id_to_defname_mapping = get_cross_section_location_id_to_defname_mapping(
             name_id_mapping=cross_section_id_mapping,
@@ -882,28 +1098,54 @@ def dflowfm2threedi(
         print("Enriching cross-section locations with cross-section definitions and friction data...")
         enrich_cross_section_locations(
             cross_section_data=cross_section_definitions,
-            gpkg=target_gpkg,
+            gpkg=gpkg,
             cross_section_id_to_defname_mapping=cross_section_id_to_defname_mapping
         )
 
     for structure_type in SUPPORTED_STRUCTURES:
-        print(f"Extracting {structure_type.__name__.lower()}s...")
+        print(f"Extracting {FEATURE_TYPE_NAMES[structure_type]}s...")
         extracted_data, field_definitions = extract_from_ini(
             ini_file=structures_path,
             object_type=structure_type,
             branches=branches
         )
-        print(f"Importing {structure_type.__name__.lower()}s...")
+        print(f"Importing {FEATURE_TYPE_NAMES[structure_type]}s...")
         import_structures(
                 source=extracted_data,
                 epsg_code=28992,
-                target=target_gpkg,
+                target=gpkg,
                 cross_section_data=cross_section_definitions,
                 field_definitions=field_definitions,
-                feature_type=structure_type.__name__.lower()
+                feature_type=FEATURE_TYPE_NAMES[structure_type]
+        )
+    structure_counts = count_structure_types(structures_path)
+    pprint(structure_counts)
+    check_structures(structures_path, structure_counts=structure_counts)
+
+
+def dflowfm2threedi(
+        target_gpkg: Path,
+        mdu_path: Path,
+        network_file_path: Path,
+        cross_section_locations_path: Path,
+        cross_def_path: Path,
+        structures_path: Path,
+        skip_branches: bool = False,
+):
+    # The target Geopackage is opened once and all imports are done in a single transaction, so that the whole
+    # conversion is committed at once, and a failed conversion leaves the target Geopackage untouched
+    gpkg = open_gpkg(target_gpkg)
+    with transaction(gpkg, target_gpkg):
+        _dflowfm2threedi(
+            gpkg=gpkg,
+            mdu_path=mdu_path,
+            network_file_path=network_file_path,
+            cross_section_locations_path=cross_section_locations_path,
+            cross_def_path=cross_def_path,
+            structures_path=structures_path,
+            skip_branches=skip_branches,
         )
-    pprint(count_structure_types(structures_path))
-    check_structures(structures_path)
+    gpkg = None
 
 
 def orifices_to_pumps(gpkg: Path, network_file: Path, structures_file: Path):
@@ -920,83 +1162,85 @@ def orifices_to_pumps(gpkg: Path, network_file: Path, structures_file: Path):
         branches=branches
     )
 
-    positive_pumps = {
-        code: feature_data for code, feature_data in extracted_data.items() if feature_data["orientation"] == "positive"
-    }
-    negative_pumps = {
-        code: feature_data for code, feature_data in extracted_data.items() if feature_data["orientation"] == "negative"
-    }
-
-    for pump_data, config in [
-        (positive_pumps, ORIFICE_TO_POSITIVE_PUMP_REPLACEMENT_CONFIG),
-        (negative_pumps, ORIFICE_TO_NEGATIVE_PUMP_REPLACEMENT_CONFIG)
-    ]:
-        replacement_data = replace_structures(
-            gpkg=gpkg,
-            source=pump_data,
-            delete_from_layer="orifice",
-            add_to_layer="pump",
-            config=config,
-            match_field="code",
-            match_prefix="Pump ",
-        )
-        map_pumps(gpkg=gpkg, replacement_data=replacement_data)
-
-
-if __name__ == "__main__":
-    dsproj_data_dir = Path(r"C:\Users\leendert.vanwolfswin\Downloads\Meppelerdiep.dsproj_data")
-    flow_fm_input_path = dsproj_data_dir / "FlowFM" / "input"
-    network_file_path = flow_fm_input_path / "FlowFM_net.nc"
-    mdu_path = flow_fm_input_path / "FlowFM.mdu"
-    cross_section_locations_path = flow_fm_input_path / "crsloc.ini"
-    cross_def_path = flow_fm_input_path / "crsdef.ini"
-    structures_path = flow_fm_input_path / "structures.ini"
-
-    target_gpkg = Path(
-        r"C:\Users\leendert.vanwolfswin\Documents\overijssel\Empty 1D schematisation.gpkg"
-    )
-
-    flow_fm_input_path = Path(
-        # r"C:\Users\leendert.vanwolfswin\Documents\overijssel\P1337 DHydro\Overijssel - P1337.dsproj_data\FlowFM\input"
-        r"C:\Users\leendert.vanwolfswin\Downloads\Meppelerdiep.dsproj_data\FlowFM\input"
-    )
-    mdu_path = flow_fm_input_path / "FlowFM.mdu"
-    # cross_def_path = flow_fm_input_path / "crsdef.ini"
-    # cross_defs = CrossDefModel(cross_def_path)
-    #
-
-    # Clear schematisation geopackage (OPTIONAL)
-    clear_gpkg(
-        gpkg=target_gpkg,
-        layers_to_clear=[
-            "connection_node",
-            "channel",
-            "cross_section_location",
-            "culvert",
-            "orifice",
-            "weir",
-            "pump",
-            "pump_map",
-        ]
+    # Split the pumps by orientation in a single pass
+    pumps_by_orientation = {orientation: dict() for orientation, _ in PUMP_ORIENTATION_CONFIGS}
+    for code, feature_data in extracted_data.items():
+        pumps = pumps_by_orientation.get(feature_data["orientation"])
+        if pumps is not None:
+            pumps[code] = feature_data
+
+    # All pumps and pump maps are written in a single transaction on a single connection to the Geopackage
+    data_source = open_gpkg(gpkg)
+    with transaction(data_source, gpkg):
+        for orientation, config in PUMP_ORIENTATION_CONFIGS:
+            replacement_data = replace_structures(
+                gpkg=data_source,
+                source=pumps_by_orientation[orientation],
+                delete_from_layer="orifice",
+                add_to_layer="pump",
+                config=config,
+                match_field="code",
+                match_prefix="Pump ",
+            )
+            map_pumps(gpkg=data_source, replacement_data=replacement_data)
+    data_source = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a D-FlowFM 1D network to a 3Di schematisation")
+    parser.add_argument("dsproj_data_dir", type=Path, help="D-Hydro dsproj_data directory")
+    parser.add_argument("target_gpkg", type=Path, help="3Di schematisation Geopackage")
+    parser.add_argument(
+        "--stage",
+        choices=["clear", "export", "pumps"],
+        nargs="+",
+        required=True,
+        help="Stage(s) to run, in the given order: "
+             "'clear' clears the schematisation Geopackage, "
+             "'export' exports the D-FlowFM data to the schematisation Geopackage, "
+             "'pumps' replaces pump-proxy orifices by real pumps (run all vector data importers first)"
     )
-
-    # Export DFlowFM data to 3Di
-    dflowfm2threedi(
-        target_gpkg=target_gpkg,
-        mdu_path=mdu_path,
-        network_file_path=network_file_path,
-        cross_section_locations_path=cross_section_locations_path,
-        cross_def_path=cross_def_path,
-        structures_path=structures_path,
-        skip_branches=True,
+    parser.add_argument(
+        "--skip-branches",
+        action="store_true",
+        help="Do not import connection nodes, channels and cross-section locations in the export stage"
     )
+    args = parser.parse_args()
 
-    ##############################################################
-    # BEFORE CONTINUING, RUN ALL THE VECTOR DATA IMPORTERS FIRST #
-    ##############################################################
+    flow_fm_input_path = args.dsproj_data_dir / "FlowFM" / "input"
+    network_file_path = flow_fm_input_path / "FlowFM_net.nc"
+    structures_path = flow_fm_input_path / "structures.ini"
 
-    # Replace pump-proxy orifices for real pumps
-    # orifices_to_pumps(gpkg=target_gpkg, network_file=network_file_path, structures_file=structures_path)
+    for stage in args.stage:
+        if stage == "clear":
+            clear_gpkg(
+                gpkg=args.target_gpkg,
+                layers_to_clear=[
+                    "connection_node",
+                    "channel",
+                    "cross_section_location",
+                    "culvert",
+                    "orifice",
+                    "weir",
+                    "pump",
+                    "pump_map",
+                ]
+            )
+        elif stage == "export":
+            dflowfm2threedi(
+                target_gpkg=args.target_gpkg,
+                mdu_path=flow_fm_input_path / "FlowFM.mdu",
+                network_file_path=network_file_path,
+                cross_section_locations_path=flow_fm_input_path / "crsloc.ini",
+                cross_def_path=flow_fm_input_path / "crsdef.ini",
+                structures_path=structures_path,
+                skip_branches=args.skip_branches,
+            )
+        elif stage == "pumps":
+            orifices_to_pumps(gpkg=args.target_gpkg, network_file=network_file_path, structures_file=structures_path)
 
     print("Klaar")
 
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,13 @@
-import configparser
-import csv
 import io
+import math
+import re
 import warnings
+from collections import Counter
 from dataclasses import dataclass
 from enum import Enum
-from types import NoneType
-from typing import List, Optional, Dict, Type, SupportsRound, Tuple
+from functools import lru_cache, partial
+from operator import attrgetter
+from typing import List, Optional, Dict, Type, SupportsRound, Tuple, get_origin
 from pathlib import Path
 
 from hydrolib.core.dflowfm import (
@@ -35,6 +37,7 @@ from hydrolib.core.dflowfm.friction.models import (
 )
 
 import numpy as np
+import shapely
 from hydrolib.core.dflowfm.ini.models import INIBasedModel
 from osgeo import ogr
 from shapely import LineString, Point
@@ -42,6 +45,7 @@ from shapely import LineString, Point
 ogr.UseExceptions()
 
 ASSUMED_WATER_DEPTH = 1
+ASSUMED_WATER_DEPTH_CUBE_ROOT = ASSUMED_WATER_DEPTH ** (1 / 3)
 SUPPORTED_STRUCTURES = (Bridge, Weir, Culvert, Orifice, Compound, Pump, UniversalWeir)
 SUPPORTED_CROSS_SECTIONS = (
     CircleCrsDef,
@@ -51,6 +55,15 @@ SUPPORTED_CROSS_SECTIONS = (
     ZWRiverCrsDef
 )
 
+# {object_type: (extraction model, attribute of the extraction model that holds the objects, primary key getter)}
+INI_EXTRACTION_CONFIG = {
+    CrossSection: (CrossLocModel, "crosssection", attrgetter("id")),
+    **{object_type: (CrossDefModel, "definition", attrgetter("id")) for object_type in SUPPORTED_CROSS_SECTIONS},
+    **{object_type: (StructureModel, "structure", attrgetter("id")) for object_type in SUPPORTED_STRUCTURES},
+    FrictGlobal: (FrictionModel, "global_", attrgetter("frictionid")),
+    FrictBranch: (FrictionModel, "branch", attrgetter("branchid")),
+}
+
 OGR_FIELD_TYPES = {
     str: ogr.OFTString,
     int: ogr.OFTInteger,
@@ -86,6 +99,18 @@ class ThreeDiFrictionType(Enum):
 
 
 class ThreeDiCrossSectionData:
+    __slots__ = (
+        "cross_section_shape",
+        "code",
+        "reference_level",
+        "bank_level",
+        "cross_section_width",
+        "cross_section_height",
+        "friction_data",
+        "_cross_section_table",
+        "_table_array",
+        "_table_array_is_newer",
+    )
     fields = {
         "reference_level": float,
         "bank_level": float,
@@ -115,29 +140,65 @@ class ThreeDiCrossSectionData:
         self.cross_section_table = cross_section_table
         self.friction_data = friction_data
 
-    def _parse_cross_section_table(self) -> Tuple[List, List] | Tuple[None, None]:
-        """Returns the columns in a csv-style table as lists of float"""
-        if self.cross_section_shape in TABLE_SHAPES and self.cross_section_table:
-            parsed_table = [row.split(",") for row in self.cross_section_table.split("\n")]
-            height_values, width_values = list(zip(*parsed_table))
-            return height_values, width_values
-        else:
+    @property
+    def cross_section_table(self) -> Optional[str]:
+        if self._table_array_is_newer:
+            # the table array has been modified (e.g. by shift_down()), so the csv-style table has to be regenerated
+            self._cross_section_table = lists_to_csv(self._table_array.T)
+            self._table_array_is_newer = False
+        return self._cross_section_table
+
+    @cross_section_table.setter
+    def cross_section_table(self, value: Optional[str]):
+        self._cross_section_table = value
+        self._table_array: Optional[np.ndarray] = None  # parsed version of self._cross_section_table
+        self._table_array_is_newer = False
+
+    def _get_table_array(self) -> Optional[np.ndarray]:
+        """
+        Returns the csv-style table as a (rows, columns) float array, or None if there is no table.
+        The table is parsed only once, until ``self.cross_section_table`` is set.
+        """
+        if self.cross_section_shape not in TABLE_SHAPES:
+            return None
+        if self._table_array is None:
+            if not self._cross_section_table:
+                return None
+            table_array = np.loadtxt(io.StringIO(self._cross_section_table), delimiter=",", dtype=float, ndmin=2)
+            if not (table_array.ndim == 2 and table_array.shape[1] == 2):
+                raise ValueError(f"Cross-section table must have 2 columns, not {table_array.shape[-1]}")
+            self._table_array = table_array
+        return self._table_array
+
+    def _parse_cross_section_table(self) -> Tuple[np.ndarray, np.ndarray] | Tuple[None, None]:
+        """Returns the columns in a csv-style table as float arrays"""
+        table_array = self._get_table_array()
+        if table_array is None:
             return None, None
+        return table_array[:, 0], table_array[:, 1]
 
     @property
-    def is_valid(self):
-        self._parse_cross_section_table()  # if not valid, this will raise an exception
+    def is_valid(self) -> bool:
+        """Tabulated cross-sections are invalid if their table cannot be parsed into 2 columns of numbers"""
+        if self.cross_section_shape not in TABLE_SHAPES or not self.cross_section_table:
+            return True
+        try:
+            self._get_table_array()  # parsed only once, see _get_table_array()
+        except ValueError:
+            return False
         return True
 
     def shift_down(self, shift: float):
-        values = list(self._parse_cross_section_table())
-        if values != [None, None]:
+        table_array = self._get_table_array()
+        if table_array is not None:
             z_column_idx = 1 if self.cross_section_shape == CrossSectionShape.YZ else 0
-            values[z_column_idx] = list(np.round(np.array(values[z_column_idx]).astype(float) - shift, 4))
-            self.cross_section_table = lists_to_csv([values[0], values[1]])
+            z_column = table_array[:, z_column_idx]  # a view, so the cached array is updated in place
+            z_column -= shift
+            np.round(z_column, 4, out=z_column)
+            self._table_array_is_newer = True  # the csv-style table is regenerated when it is read
 
 
-@dataclass
+@dataclass(slots=True)
 class ThreeDiFrictionData:
     fields = {
         "friction_type": int,
@@ -150,7 +211,51 @@ class ThreeDiFrictionData:
     invalid_reason: str | None
 
 
+# {D-Hydro friction type: function that converts a friction value of that type to Manning}
+MANNING_CONVERSIONS = {
+    DHydroFrictionType.strickler: lambda value: 1 / value,
+    # whitecolebrook and debosbijkerk conversions are far from perfect but give a good approx.
+    DHydroFrictionType.whitecolebrook: lambda value: value ** (1 / 6) / 21.1,
+    DHydroFrictionType.debosbijkerk: lambda value: 1 / (value * ASSUMED_WATER_DEPTH_CUBE_ROOT),
+}
+
+
+def convert_to_manning(friction_type: DHydroFrictionType, friction_value: float) -> float:
+    """
+    Converts ``friction_value`` of D-Hydro ``friction_type`` to a Manning value, rounded to 4 decimals.
+    Plain float arithmetic and built-in round() are used, because NumPy scalar operations have a large overhead
+    compared to the calculation itself.
+    """
+    return round(MANNING_CONVERSIONS[friction_type](friction_value), 4)
+
+
+# {D-Hydro friction type: (3Di friction type, function that converts a friction value of that type to 3Di)}
+THREEDI_FRICTION_CONVERSIONS = {
+    DHydroFrictionType.chezy: (ThreeDiFrictionType.CHEZY, lambda value: value),
+    DHydroFrictionType.manning: (ThreeDiFrictionType.MANNING, lambda value: value),
+    **{
+        friction_type: (ThreeDiFrictionType.MANNING, partial(convert_to_manning, friction_type))
+        for friction_type in MANNING_CONVERSIONS
+    },
+    None: (ThreeDiFrictionType.NONE, lambda value: None),
+}
+
+
+# {friction type value: D-Hydro friction type}, to avoid constructing the enum for every friction definition
+DHYDRO_FRICTION_TYPES = {friction_type.value: friction_type for friction_type in DHydroFrictionType}
+
+
+def dhydro_friction_type(friction_type: Optional[str]) -> Optional[DHydroFrictionType]:
+    """Returns the ``DHydroFrictionType`` for ``friction_type``, or None if ``friction_type`` is empty"""
+    if not friction_type:
+        return None
+    # fall back to the enum itself for values that are not an exact match, e.g. with different capitalization
+    return DHYDRO_FRICTION_TYPES.get(friction_type) or DHydroFrictionType(friction_type)
+
+
 class GenericFrictionDefinition:
+    __slots__ = ("friction_type", "friction_value", "is_valid", "invalid_reason")
+
     def __init__(
             self,
             friction_type: DHydroFrictionType = None,
@@ -166,12 +271,12 @@ class GenericFrictionDefinition:
         invalid_reason
         """
         if is_valid == False:
-            self.friction_type = DHydroFrictionType(friction_type) if friction_type else None
+            self.friction_type = dhydro_friction_type(friction_type)
             self.friction_value = friction_value
             self.is_valid = is_valid
             self.invalid_reason = invalid_reason
         else:
-            self.friction_type = DHydroFrictionType(friction_type) if friction_type else None
+            self.friction_type = dhydro_friction_type(friction_type)
             self.friction_value = friction_value
             self.is_valid = True
             self.invalid_reason = None
@@ -180,26 +285,10 @@ class GenericFrictionDefinition:
         if self.is_valid:
             conversion_success = True
             failure_reason = None
-            if self.friction_type == DHydroFrictionType.chezy:
-                friction_type = ThreeDiFrictionType.CHEZY
-                friction_value = self.friction_value
-            elif self.friction_type == DHydroFrictionType.manning:
-                friction_type = ThreeDiFrictionType.MANNING
-                friction_value = self.friction_value
-            elif self.friction_type == DHydroFrictionType.strickler:
-                friction_type = ThreeDiFrictionType.MANNING
-                friction_value = np.round(1 / self.friction_value, 4)
-            elif self.friction_type == DHydroFrictionType.whitecolebrook:
-                friction_type = ThreeDiFrictionType.MANNING
-                friction_value = np.round(self.friction_value ** (1 / 6) / 21.1, 4)  # this is far from perfect
-                # but gives a good approx.
-            elif self.friction_type == DHydroFrictionType.debosbijkerk:
-                friction_type = ThreeDiFrictionType.MANNING
-                friction_value = np.round(1 / (self.friction_value * ASSUMED_WATER_DEPTH ** (1 / 3)), 4)  # this
-                # is far from perfect but gives a good approx.
-            elif self.friction_type is None:
-                friction_type = ThreeDiFrictionType.NONE
-                friction_value = None
+            conversion = THREEDI_FRICTION_CONVERSIONS.get(self.friction_type)
+            if conversion is not None:
+                friction_type, convert = conversion
+                friction_value = convert(self.friction_value)
             else:
                 friction_type = ThreeDiFrictionType.NONE
                 friction_value = None
@@ -224,7 +313,48 @@ class GenericFrictionDefinition:
         return result
 
 
+def friction_definitions_to_threedi(
+        friction_definitions: List[GenericFrictionDefinition]
+) -> List[ThreeDiFrictionData]:
+    """
+    Returns ``[friction_definition.to_threedi() for friction_definition in friction_definitions]``, but converts the
+    friction values that need conversion to Manning in one NumPy operation per friction type.
+    Only finite, positive values are converted in batch; all other values go through ``to_threedi()``, so that they
+    fail in the same way as when they are converted one by one.
+    """
+    # {friction type: indices of the friction definitions of that type that need conversion}, collected in one pass
+    indices_per_type = dict()
+    for i, friction_definition in enumerate(friction_definitions):
+        if (
+                friction_definition.is_valid
+                and friction_definition.friction_type in MANNING_CONVERSIONS
+                and friction_definition.friction_value is not None
+                and math.isfinite(friction_definition.friction_value)
+                and friction_definition.friction_value > 0
+        ):
+            indices_per_type.setdefault(friction_definition.friction_type, []).append(i)
+    result = [None] * len(friction_definitions)
+    for friction_type, indices in indices_per_type.items():
+        conversion = MANNING_CONVERSIONS[friction_type]
+        values = np.array([friction_definitions[i].friction_value for i in indices], dtype=float)
+        for i, converted_value in zip(indices, conversion(values).tolist()):
+            # round() instead of np.round(), to get the same values as convert_to_manning()
+            friction_value = round(converted_value, 4)
+            result[i] = ThreeDiFrictionData(
+                friction_type=ThreeDiFrictionType.MANNING,
+                friction_value=friction_value,
+                is_valid=True,
+                invalid_reason="",
+            )
+    return [
+        friction_data if friction_data is not None else friction_definition.to_threedi()
+        for friction_definition, friction_data in zip(friction_definitions, result)
+    ]
+
+
 class GlobalFrictionDefinition(GenericFrictionDefinition):
+    __slots__ = ("friction_id",)
+
     def __init__(
             self,
             friction_id: str,
@@ -247,6 +377,8 @@ class GlobalFrictionDefinition(GenericFrictionDefinition):
 
 
 class BranchFrictionDefinition(GenericFrictionDefinition):
+    __slots__ = ("branch_id", "chainage")
+
     def __init__(
             self,
             branch_id: str,
@@ -281,12 +413,20 @@ def none_round(number: SupportsRound, ndigits: int = None):
     return round(number, ndigits) if number is not None else None
 
 
-def lists_to_csv(columns: List[List[float]], decimals=None) -> str:
+def none_round_column(values: List[Optional[float]], ndigits: int) -> List[Optional[float]]:
+    """
+    ``none_round()`` for a column of values. Built-in round() is used, so that the results are the same as those of
+    ``none_round()`` (np.round() rounds differently, e.g. -0.4565 to -0.456 instead of -0.457)
     """
-    Convert multiple lists (columns) into a CSV-style string.
+    return [None if value is None else round(value, ndigits) for value in values]
+
+
+def lists_to_csv(columns: List[List[float] | np.ndarray] | np.ndarray, decimals=None) -> str:
+    """
+    Convert multiple lists (columns) into a CSV-style string. ``columns`` may also be a 2-D (columns, rows) array.
     Returns an empty string if no data is provided.
     """
-    if not columns:
+    if len(columns) == 0:
         return ""
 
     # Ensure all columns have the same length
@@ -295,16 +435,50 @@ def lists_to_csv(columns: List[List[float]], decimals=None) -> str:
         raise ValueError("All columns must have the same length")
 
     if decimals:
-        columns = [np.round(np.array(column, dtype=float), decimals=decimals).tolist() for column in columns]
-
-    output = io.StringIO()
-    writer = csv.writer(output, lineterminator="\n")
+        # Round and format all values in a single NumPy pass
+        str_columns = np.round(np.array(columns, dtype=float), decimals=decimals).astype(str).tolist()
+    elif isinstance(columns, np.ndarray):
+        str_columns = columns.astype(str).tolist()
+    else:
+        str_columns = [["" if value is None else str(value) for value in column] for column in columns]
 
     # Write the rows (transposed data)
-    for row in zip(*columns):
-        writer.writerow(row)
+    return "\n".join(",".join(row) for row in zip(*str_columns))
+
+
+def _model_fields(model_class: Type) -> Dict:
+    """
+    Returns the {field name: field} dict of pydantic model class ``model_class`` (``model_fields`` in pydantic v2,
+    ``__fields__`` in pydantic v1), or an empty dict if it is not a pydantic model
+    """
+    return getattr(model_class, "model_fields", None) or getattr(model_class, "__fields__", None) or dict()
+
+
+def _get_attribute_names(obj: INIBasedModel) -> List[str]:
+    """
+    Returns the public, non-callable attribute names of ``obj``, sorted alphabetically.
+    For pydantic models, the declared fields are used, which is much cheaper than inspecting ``dir(obj)``
+    """
+    model_fields = _model_fields(type(obj))
+    if model_fields:
+        candidates = sorted(model_fields.keys())
+    else:
+        candidates = dir(obj)
+    return [attr for attr in candidates if not attr.startswith("_") and not callable(getattr(obj, attr))]
 
-    return output.getvalue().rstrip("\n")
+
+def _annotated_python_type(obj: INIBasedModel, attribute: str) -> Optional[type]:
+    """
+    Returns the type that all values of ``attribute`` are guaranteed to have according to the pydantic field
+    annotation (lists are written as comma-separated strings), or None if this cannot be derived from the annotation
+    """
+    model_fields = _model_fields(type(obj))
+    annotation = getattr(model_fields.get(attribute), "annotation", None)
+    if annotation in (str, bool):
+        return annotation
+    if get_origin(annotation) is list:
+        return str
+    return None
 
 
 def get_field_definitions(objects: List[INIBasedModel]) -> List[ogr.FieldDefn]:
@@ -323,32 +497,36 @@ def get_field_definitions(objects: List[INIBasedModel]) -> List[ogr.FieldDefn]:
     elif len(object_types) > 1:
         raise ValueError(f"Objects must be of exactly 1 type, not {object_types}")
 
-    attributes = []
-    for attr in dir(objects[0]):
-        if not attr.startswith("_") and not callable(getattr(objects[0], attr)):
-            attributes.append(attr)
+    attributes = _get_attribute_names(objects[0])
+    annotated_types = {attribute: _annotated_python_type(objects[0], attribute) for attribute in attributes}
 
-    for attribute in attributes:
-        python_types = set()
-        for structure in objects:
-            attribute_value = getattr(structure, attribute)
-            if isinstance(attribute_value, list):
-                attribute_value = ",".join([str(x) for x in attribute_value])
-            if type(attribute_value) in OGR_FIELD_TYPES.keys():
-                python_types.add(type(attribute_value))
+    # Collect the types of the values of the attributes that cannot be derived from the annotation. Each object is
+    # visited once, reading all its attributes in one go
+    scanned_attributes = [
+        (attribute, attrgetter(attribute)) for attribute in attributes if annotated_types[attribute] is None
+    ]
+    python_types_per_attribute = {attribute: set() for attribute, _ in scanned_attributes}
+    for structure in objects:
+        for attribute, get_attribute in scanned_attributes:
+            attribute_value = get_attribute(structure)
+            # lists are written as comma-separated strings
+            python_type = str if isinstance(attribute_value, list) else type(attribute_value)
+            if python_type in OGR_FIELD_TYPES:
+                python_types = python_types_per_attribute[attribute]
+                python_types.add(python_type)
+                if len(python_types) > 1:
+                    raise ValueError(f"The values in field {attribute} have different types: {python_types}")
 
-        if len(python_types) == 2:
-            python_types.discard(NoneType)
+    for attribute in attributes:
+        if annotated_types[attribute] is not None:
+            result.append(ogr.FieldDefn(attribute, OGR_FIELD_TYPES[annotated_types[attribute]]))
+            continue
 
+        python_types = python_types_per_attribute[attribute]
         if len(python_types) == 0:
             pass  # we are dealing with some other type of attribute that we don't need
-        elif len(python_types) == 1:
-            if list(python_types)[0] == NoneType:
-                result.append(ogr.FieldDefn(attribute, OGR_FIELD_TYPES[str]))
-            else:
-                result.append(ogr.FieldDefn(attribute, OGR_FIELD_TYPES[python_types.pop()]))
-        elif len(python_types) > 1:
-            raise ValueError(f"The values in field {attribute} have different types: {python_types}")
+        else:
+            result.append(ogr.FieldDefn(attribute, OGR_FIELD_TYPES[python_types.pop()]))
     return result
 
 
@@ -358,122 +536,245 @@ def geometry_from_chainage(branches: Dict, branch_id: str, chainage: float) -> P
     return branch_geom.interpolate(chainage)
 
 
-def cross_section_def2threedi(
-        cross_section_definition: CrossSectionDefinition,
-        friction_definitions: Dict[str, GlobalFrictionDefinition]
-):
+def geometries_from_chainages(branches: Dict, branch_ids: List[str], chainages: List[float]) -> np.ndarray:
     """
-    Note that for tabulated cross-sections such as ZW, ZW River, YZ, etc. the flow widths are used and the total widths
-    are ignored
+    Vectorized version of ``geometry_from_chainage()``.
+
+    The vertices and cumulative vertex distances of each branch are computed only once, after which all chainages on
+    that branch are interpolated in one go. Chainages outside the branch are clamped to its start or end point.
     """
+    chainages = np.array(chainages, dtype=float)
+    coordinates = np.empty((len(chainages), 2), dtype=float)
+    indices_per_branch = dict()
+    for i, branch_id in enumerate(branch_ids):
+        indices_per_branch.setdefault(branch_id, []).append(i)
+    for branch_id, on_branch in indices_per_branch.items():
+        vertices = shapely.get_coordinates(branches[branch_id]["geometry"])
+        cumulative_length = np.concatenate([[0.0], np.cumsum(np.linalg.norm(np.diff(vertices, axis=0), axis=1))])
+        coordinates[on_branch, 0] = np.interp(chainages[on_branch], cumulative_length, vertices[:, 0])
+        coordinates[on_branch, 1] = np.interp(chainages[on_branch], cumulative_length, vertices[:, 1])
+    return shapely.points(coordinates)
+
+
+def _friction_definition_from_single_values(
+        cross_section_definition: CrossSectionDefinition
+) -> GlobalFrictionDefinition:
+    """Friction data: CircleCrsDef, RectangleCrsDef, ZWCrsDef"""
+    return GlobalFrictionDefinition(
+        friction_id=cross_section_definition.frictionid,
+        friction_type=dhydro_friction_type(cross_section_definition.frictiontype),
+        friction_value=cross_section_definition.frictionvalue,
+    )
 
-    # Friction data: CircleCrsDef, RectangleCrsDef, ZWCrsDef
-    if type(cross_section_definition) in [CircleCrsDef, RectangleCrsDef, ZWCrsDef]:
-        friction_definition = GlobalFrictionDefinition(
-            friction_id=cross_section_definition.frictionid,
-            friction_type=DHydroFrictionType(cross_section_definition.frictiontype) if
-            cross_section_definition.frictiontype else None,
-            friction_value=cross_section_definition.frictionvalue,
-        )
 
-    # Friction data: ZWRiverCrsDef, YZCrsDef
-    elif type(cross_section_definition) in [ZWRiverCrsDef, YZCrsDef]:
-        friction_id = None
-        friction_type = None
-        friction_value = None
-        is_valid = None
-        invalid_reason = None
-        if cross_section_definition.frictiontypes is not None and cross_section_definition.frictionvalues is not None:
-            if len(cross_section_definition.frictiontypes) == 1 and len(cross_section_definition.frictionvalues) == 1:
-                friction_type = cross_section_definition.frictiontypes[0]
-                friction_value = cross_section_definition.frictionvalues[0]
-            else:
-                is_valid = False
-                invalid_reason = "Multiple friction values for one cross-section are not yet supported."
-        if cross_section_definition.frictionids is not None:
-            if len(cross_section_definition.frictionids) == 1:
-                friction_id = cross_section_definition.frictionids[0]
-            elif friction_type is None and friction_value is None:
-                is_valid = False
-                invalid_reason = "Multiple friction values for one cross-section are not yet supported."
-
-        friction_definition = GlobalFrictionDefinition(
-            friction_id=friction_id,
-            friction_type=friction_type,
-            friction_value=friction_value,
-            is_valid=is_valid,
-            invalid_reason=invalid_reason,
-        )
-
-    # Cross-section data
-    width = None
-    height = None
-    table = None
-    reference_level = None
-    bank_level = None
-
-    if isinstance(cross_section_definition, CircleCrsDef):
-        shape = CrossSectionShape.CIRCLE
-        width = cross_section_definition.diameter
-    elif isinstance(cross_section_definition, RectangleCrsDef):
-        width = cross_section_definition.width
-        if cross_section_definition.closed:
-            shape = CrossSectionShape.CLOSED_RECTANGLE
-            height = cross_section_definition.height
+def _friction_definition_from_lists(
+        cross_section_definition: CrossSectionDefinition
+) -> GlobalFrictionDefinition:
+    """Friction data: ZWRiverCrsDef, YZCrsDef"""
+    friction_id = None
+    friction_type = None
+    friction_value = None
+    is_valid = None
+    invalid_reason = None
+    if cross_section_definition.frictiontypes is not None and cross_section_definition.frictionvalues is not None:
+        if len(cross_section_definition.frictiontypes) == 1 and len(cross_section_definition.frictionvalues) == 1:
+            friction_type = cross_section_definition.frictiontypes[0]
+            friction_value = cross_section_definition.frictionvalues[0]
         else:
-            shape = CrossSectionShape.OPEN_RECTANGLE
-    elif isinstance(cross_section_definition, ZWCrsDef):
-        # TODO: remove Preismann slots (if last width is < threshold value, set to 0)
-        shape = CrossSectionShape.TABULATED_TRAPEZIUM
-        table = lists_to_csv(
-            [
-                cross_section_definition.levels,
-                cross_section_definition.flowwidths
-            ],
-            decimals=3
-        )
+            is_valid = False
+            invalid_reason = "Multiple friction values for one cross-section are not yet supported."
+    if cross_section_definition.frictionids is not None:
+        if len(cross_section_definition.frictionids) == 1:
+            friction_id = cross_section_definition.frictionids[0]
+        elif friction_type is None and friction_value is None:
+            is_valid = False
+            invalid_reason = "Multiple friction values for one cross-section are not yet supported."
+
+    return GlobalFrictionDefinition(
+        friction_id=friction_id,
+        friction_type=friction_type,
+        friction_value=friction_value,
+        is_valid=is_valid,
+        invalid_reason=invalid_reason,
+    )
 
-    elif isinstance(cross_section_definition, ZWRiverCrsDef):
-        # TODO: uitzoeken hoe dit nou precies zit, klinkt behoorlijk complex
-        # TODO: remove Preismann slots (if last width is < threshold value, set to 0)
-        shape = CrossSectionShape.TABULATED_TRAPEZIUM
-        table = lists_to_csv(
-            [
-                cross_section_definition.levels,
-                cross_section_definition.flowwidths
-            ],
-            decimals=3
-        )
-        bank_level = cross_section_definition.leveecrestLevel
-
-    elif isinstance(cross_section_definition, YZCrsDef):
-        # TODO: remove Preismann slots (if abs(first Y - last Y) < threshold value, set them both to the average of these)
-        # TODO find out what "singleValuedZ" means and if we need it somehow
-        shape = CrossSectionShape.YZ
-        reference_level = float(np.min(np.array(cross_section_definition.zcoordinates)))
-        table = lists_to_csv(
-            [
-                list(np.array(cross_section_definition.ycoordinates) - cross_section_definition.ycoordinates[0]),
-                list(np.array(cross_section_definition.zcoordinates) - reference_level)
-            ],
-            decimals=3
-        )
-    else:
+
+# {cross-section definition type: function that returns the friction definition of such a cross-section definition}
+FRICTION_DEFINITION_HANDLERS = {
+    CircleCrsDef: _friction_definition_from_single_values,
+    RectangleCrsDef: _friction_definition_from_single_values,
+    ZWCrsDef: _friction_definition_from_single_values,
+    ZWRiverCrsDef: _friction_definition_from_lists,
+    YZCrsDef: _friction_definition_from_lists,
+}
+
+
+def cross_section_friction_definition(
+        cross_section_definition: CrossSectionDefinition
+) -> Optional[GlobalFrictionDefinition]:
+    """
+    Returns the friction definition that is part of ``cross_section_definition``, or None for unsupported
+    cross-section types
+    """
+    handler = FRICTION_DEFINITION_HANDLERS.get(type(cross_section_definition))
+    return handler(cross_section_definition) if handler else None
+
+
+def _circle_cross_section_data(cross_section_definition: CircleCrsDef) -> Dict:
+    return {"shape": CrossSectionShape.CIRCLE, "width": cross_section_definition.diameter}
+
+
+def _rectangle_cross_section_data(cross_section_definition: RectangleCrsDef) -> Dict:
+    if cross_section_definition.closed:
+        return {
+            "shape": CrossSectionShape.CLOSED_RECTANGLE,
+            "width": cross_section_definition.width,
+            "height": cross_section_definition.height,
+        }
+    return {"shape": CrossSectionShape.OPEN_RECTANGLE, "width": cross_section_definition.width}
+
+
+def _zw_cross_section_data(cross_section_definition: ZWCrsDef) -> Dict:
+    # TODO: remove Preismann slots (if last width is < threshold value, set to 0)
+    table = lists_to_csv(
+        [
+            cross_section_definition.levels,
+            cross_section_definition.flowwidths
+        ],
+        decimals=3
+    )
+    return {"shape": CrossSectionShape.TABULATED_TRAPEZIUM, "table": table}
+
+
+def _zw_river_cross_section_data(cross_section_definition: ZWRiverCrsDef) -> Dict:
+    # TODO: uitzoeken hoe dit nou precies zit, klinkt behoorlijk complex
+    # TODO: remove Preismann slots (if last width is < threshold value, set to 0)
+    table = lists_to_csv(
+        [
+            cross_section_definition.levels,
+            cross_section_definition.flowwidths
+        ],
+        decimals=3
+    )
+    return {
+        "shape": CrossSectionShape.TABULATED_TRAPEZIUM,
+        "table": table,
+        "bank_level": cross_section_definition.leveecrestLevel,
+    }
+
+
+def _yz_cross_section_data(cross_section_definition: YZCrsDef) -> Dict:
+    # TODO: remove Preismann slots (if abs(first Y - last Y) < threshold value, set them both to the average of these)
+    # TODO find out what "singleValuedZ" means and if we need it somehow
+    y = np.array(cross_section_definition.ycoordinates, dtype=float)
+    z = np.array(cross_section_definition.zcoordinates, dtype=float)
+    reference_level = float(z.min())
+    y -= y[0]
+    z -= reference_level
+    table = lists_to_csv([y, z], decimals=3)
+    return {"shape": CrossSectionShape.YZ, "table": table, "reference_level": reference_level}
+
+
+# {cross-section definition type: function that returns the 3Di cross-section data of such a cross-section definition}
+# Like FRICTION_DEFINITION_HANDLERS, this is looked up by exact type, so that subclasses of supported cross-section
+# definitions (e.g. XYZCrsDef, a YZCrsDef) are not silently handled as their base class
+CROSS_SECTION_DATA_HANDLERS = {
+    CircleCrsDef: _circle_cross_section_data,
+    RectangleCrsDef: _rectangle_cross_section_data,
+    ZWCrsDef: _zw_cross_section_data,
+    ZWRiverCrsDef: _zw_river_cross_section_data,
+    YZCrsDef: _yz_cross_section_data,
+}
+
+
+def cross_section_data(cross_section_definition: CrossSectionDefinition) -> Dict:
+    """
+    Returns the unrounded 3Di cross-section data (shape, width, height, table, reference_level, bank_level) of
+    ``cross_section_definition``; keys that do not apply are missing.
+
+    Note that for tabulated cross-sections such as ZW, ZW River, YZ, etc. the flow widths are used and the total widths
+    are ignored
+    """
+    handler = CROSS_SECTION_DATA_HANDLERS.get(type(cross_section_definition))
+    if handler is None:
         raise ValueError(
             f"Unknown cross-section type: {type(cross_section_definition)} "
             f"for cross-section {cross_section_definition.id}"
         )
+    return handler(cross_section_definition)
+
+
+@lru_cache(maxsize=None)
+def _parse_ini(extraction_model: Type, ini_file: Path, modified: int):
+    """Cached backend of ``parse_ini()``. ``modified`` is only used as part of the cache key"""
+    return extraction_model(ini_file)
 
-    return ThreeDiCrossSectionData(
-        code=cross_section_definition.id,
-        bank_level=none_round(bank_level, 3),
-        reference_level=none_round(reference_level, 3),
-        cross_section_shape=shape,
-        cross_section_width=none_round(width, 3),
-        cross_section_height=none_round(height, 3),
-        cross_section_table=table,
-        friction_data=friction_definition.to_threedi()
-    )
+
+def parse_ini(extraction_model: Type, ini_file: Path):
+    """
+    Parses ``ini_file`` with hydrolib-core model ``extraction_model`` (e.g. StructureModel).
+
+    Each file is parsed only once per model, also if it is extracted multiple times (e.g. once per structure type).
+    The file is parsed again if it has been modified in the meantime. The returned model is shared between callers,
+    so it must not be modified.
+    """
+    ini_file = Path(ini_file)
+    return _parse_ini(extraction_model, ini_file, ini_file.stat().st_mtime_ns)
+
+
+@lru_cache(maxsize=None)
+def _objects_by_type(extraction_model: Type, attr_name: str, ini_file: Path, modified: int) -> Dict[Type, List]:
+    """Cached backend of ``objects_by_type()``. ``modified`` is only used as part of the cache key"""
+    result = dict()
+    for obj in getattr(_parse_ini(extraction_model, ini_file, modified), attr_name):
+        result.setdefault(type(obj), []).append(obj)
+    return result
+
+
+def objects_by_type(extraction_model: Type, attr_name: str, ini_file: Path) -> Dict[Type, List]:
+    """
+    Returns the objects in attribute ``attr_name`` of ``parse_ini(extraction_model, ini_file)``, grouped by type,
+    e.g. {Weir: [...], Orifice: [...]} for the "structure" attribute of a StructureModel.
+
+    The objects are grouped only once per file, also if they are extracted once per object type.
+    """
+    ini_file = Path(ini_file)
+    return _objects_by_type(extraction_model, attr_name, ini_file, ini_file.stat().st_mtime_ns)
+
+
+# Body of the [geometry] section of an MDU file, and the value of its FrictFile key (without trailing comment)
+GEOMETRY_SECTION_PATTERN = re.compile(rb"^[ \t]*\[geometry\][^\n]*\n(.*?)(?=^[ \t]*\[|\Z)", re.MULTILINE | re.DOTALL)
+FRICT_FILE_PATTERN = re.compile(
+    rb"^[ \t]*FrictFile[ \t]*=[ \t]*([^#\r\n]*?)[ \t]*(?:#[^\r\n]*)?\r?$", re.MULTILINE | re.IGNORECASE
+)
+
+
+@lru_cache(maxsize=None)
+def _friction_files(mdu_file: Path, modified: int) -> Tuple[Path, ...]:
+    """Cached backend of ``friction_files()``. ``modified`` is only used as part of the cache key"""
+    # We read the MDU file with generic python libraries
+    # because reading it with hydrolib-core raises all sorts of validation errors.
+    # Only the FrictFile key of the [geometry] section is needed, so we search for it directly instead of parsing the
+    # whole file
+    geometry_section = GEOMETRY_SECTION_PATTERN.search(mdu_file.read_bytes())
+    frict_file_match = FRICT_FILE_PATTERN.search(geometry_section.group(1)) if geometry_section else None
+    if frict_file_match is None:
+        raise KeyError(f"FrictFile not found in [geometry] section of {mdu_file}")
+    frict_files = frict_file_match.group(1).decode().split(";")
+    return tuple(mdu_file.parent / frict_file for frict_file in frict_files)
+
+
+def friction_files(mdu_file: Path) -> Tuple[Path, ...]:
+    """
+    Returns the paths of the friction files referenced in the MDU file. The MDU file is read only once, unless it has
+    been modified in the meantime.
+    """
+    mdu_file = Path(mdu_file)
+    return _friction_files(mdu_file, mdu_file.stat().st_mtime_ns)
+
+
+def _list_to_str(values: List) -> str:
+    return ",".join(map(str, values))
 
 
 def extract_from_ini(
@@ -482,55 +783,43 @@ def extract_from_ini(
         branches: Optional[Dict] = None
 ) -> Tuple[Dict, List[ogr.FieldDefn]]:
     """``branches`` is only required if objects have a branchid and chainage from which to construct a geometry"""
-    if object_type == CrossSection:
-        extraction_model = CrossLocModel
-        attr_name = "crosssection"
-        get_primary_key = lambda obj: obj.id
-    elif object_type in SUPPORTED_CROSS_SECTIONS:
-        extraction_model = CrossDefModel
-        attr_name = "definition"
-        get_primary_key = lambda obj: obj.id
-    elif object_type in SUPPORTED_STRUCTURES:
-        extraction_model = StructureModel
-        attr_name = "structure"
-        get_primary_key = lambda obj: obj.id
-    elif object_type == FrictGlobal:
-        extraction_model = FrictionModel
-        attr_name = "global_"
-        get_primary_key = lambda obj: obj.frictionid
-    elif object_type == FrictBranch:
-        extraction_model = FrictionModel
-        attr_name = "branch"
-        get_primary_key = lambda obj: obj.branchid
-    else:
+    try:
+        extraction_model, attr_name, get_primary_key = INI_EXTRACTION_CONFIG[object_type]
+    except KeyError:
         raise ValueError(f"Cannot extract features for object_type {object_type}")
-    extracted = extraction_model(ini_file)
-    unfiltered_objects = getattr(extracted, attr_name)
-    objects = [o for o in unfiltered_objects if isinstance(o, object_type)]
-    has_geometry = all([hasattr(obj, "chainage") for obj in objects])
+    objects = objects_by_type(extraction_model, attr_name, ini_file).get(object_type, [])
+    # all objects are of the same type, so whether they have a chainage follows from the type
+    has_geometry = "chainage" in _model_fields(object_type) or hasattr(object_type, "chainage")
     layer_dict = dict()
     field_definitions = get_field_definitions(objects)
-    for obj in objects:
-        feature_dict = dict()
-        if has_geometry:
-            if isinstance(obj.chainage, float):
-                chainages = [obj.chainage]
-            else:
-                chainages = obj.chainage
-        else:
-            chainages = [None]
+    field_names = [field_definition.name for field_definition in field_definitions]
+    # Read all field values of an object in a single call (attrgetter() only returns a tuple for multiple fields)
+    get_values = attrgetter(*field_names) if len(field_names) > 1 else \
+        lambda obj: tuple(getattr(obj, field_name) for field_name in field_names)
+    if has_geometry:
+        chainages_per_object = [
+            [obj.chainage] if isinstance(obj.chainage, float) else obj.chainage for obj in objects
+        ]
+        # Interpolate the points for all chainages of all objects in one go
+        geometry_branch_ids = [
+            obj.branchid for obj, chainages in zip(objects, chainages_per_object) for chainage in chainages if chainage
+        ]
+        geometry_chainages = [
+            chainage for chainages in chainages_per_object for chainage in chainages if chainage
+        ]
+        geometries = iter(
+            geometries_from_chainages(branches=branches, branch_ids=geometry_branch_ids, chainages=geometry_chainages)
+        )
+    else:
+        chainages_per_object = [[None]] * len(objects)
+    for obj, chainages in zip(objects, chainages_per_object):
+        # list values are converted once per object, not once per chainage
+        obj_values = [_list_to_str(value) if isinstance(value, list) else value for value in get_values(obj)]
         for chainage in chainages:
+            feature_dict = dict()
             if chainage:
-                feature_dict["geometry"] = geometry_from_chainage(
-                    branches=branches,
-                    branch_id=obj.branchid,
-                    chainage=chainage
-                )
-            for field_definition in field_definitions:
-                value = getattr(obj, field_definition.name)
-                if isinstance(value, list):
-                    value = ",".join([str(x) for x in value])
-                feature_dict[field_definition.name] = value
+                feature_dict["geometry"] = next(geometries)
+            feature_dict.update(zip(field_names, obj_values))
             primary_key = get_primary_key(obj)
             if len(chainages) > 1:
                 primary_key = str(primary_key) + f": {chainage:.3f}"
@@ -543,13 +832,15 @@ def extract_from_ini(
 
 
 def features_have_geometry(features: Dict) -> bool | None:
-    result = {"geometry" in feature_data for feature_data in features.values()}
-    if len(result) == 0:
+    feature_data_iter = iter(features.values())
+    first_feature_data = next(feature_data_iter, None)
+    if first_feature_data is None:
         return None
-    elif len(result) == 2:
+    result = "geometry" in first_feature_data
+    # stop at the first feature that differs from the first one
+    if any(("geometry" in feature_data) != result for feature_data in feature_data_iter):
         raise ValueError("Features dict contains mixed set of features with and without geometry")
-    else:
-        return result.pop()
+    return result
 
 
 def read_friction(mdu_file: Path) -> Tuple[
@@ -561,81 +852,66 @@ def read_friction(mdu_file: Path) -> Tuple[
          - a {friction_id: GlobalFrictionDefinition} dict
          - a {branch_id: List[BranchFrictionDefinition]} dict
     """
-    # We read the MDU file with generic python libraries
-    # because reading it with hydrolib-core raises all sorts of validation errors
-    mdu = configparser.ConfigParser()
-    mdu.read(mdu_file)
-    frict_files = mdu["geometry"]["FrictFile"].split(";")
-    frict_global_list: List[FrictGlobal] = list()  # All FrictGlobal items from all frict files will be collected here
-    frict_branch_list: List[FrictBranch] = list()  # All FrictBranch items from all frict files will be collected here
     friction_definitions_dict = dict()
     branch_friction_definitions_dict = dict()
-    for frict_file in frict_files:
-        friction_path = mdu_file.parent / frict_file
-        friction_definitions = FrictionModel(friction_path)
-        frict_global_list += friction_definitions.global_
-        frict_branch_list += friction_definitions.branch
-
-    # get friction definitions from global entries
-    for friction_definition in frict_global_list:
-        friction_definitions_dict[friction_definition.frictionid] = GlobalFrictionDefinition(
-            friction_id=friction_definition.frictionid,
-            friction_type=DHydroFrictionType(friction_definition.frictiontype) if
-            friction_definition.frictiontype else None,
-            friction_value=friction_definition.frictionvalue
-        )
+    for friction_path in friction_files(mdu_file):
+        friction_definitions = parse_ini(FrictionModel, friction_path)
+
+        # get friction definitions from global entries
+        for friction_definition in friction_definitions.global_:
+            friction_definitions_dict[friction_definition.frictionid] = GlobalFrictionDefinition(
+                friction_id=friction_definition.frictionid,
+                friction_type=dhydro_friction_type(friction_definition.frictiontype),
+                friction_value=friction_definition.frictionvalue
+            )
 
-    # get friction definitions from branch entries
-    for friction_definition in frict_branch_list:
-        if not friction_definition.chainage:
-            continue
+        # get friction definitions from branch entries
+        for friction_definition in friction_definitions.branch:
+            if not friction_definition.chainage:
+                continue
+
+            if friction_definition.functiontype.lower() != 'constant':
+                warnings.warn(
+                    f"Friction definition with a function type other than 'constant' are not supported. "
+                    f"Function type: {friction_definition.functiontype}. "
+                    f"Branch ID: {friction_definition.branchid}. "
+                    f"Chainage: {friction_definition.chainage}."
+                )
 
-        if friction_definition.functiontype.lower() != 'constant':
-            warnings.warn(
-                f"Friction definition with a function type other than 'constant' are not supported. "
-                f"Function type: {friction_definition.functiontype}. "
-                f"Branch ID: {friction_definition.branchid}. "
-                f"Chainage: {friction_definition.chainage}."
-            )
+            if len(friction_definition.frictionvalues) < len(friction_definition.chainage):
+                raise ValueError(
+                    f"Friction definition for branch {friction_definition.branchid} has fewer friction values "
+                    f"({len(friction_definition.frictionvalues)}) than chainages "
+                    f"({len(friction_definition.chainage)})"
+                )
 
-        friction_definitions_for_this_branch = []
-        for i, chainage in enumerate(friction_definition.chainage):
-            branch_friction_definition = BranchFrictionDefinition(
-                branch_id=friction_definition.branchid,
-                chainage=chainage,
-                friction_type=DHydroFrictionType(friction_definition.frictiontype) if
-                friction_definition.frictiontype else None,
-                friction_value=friction_definition.frictionvalues[i]
+            friction_type = dhydro_friction_type(friction_definition.frictiontype)
+            # A branch may occur in more than one frict file; keep the definitions from all of them
+            branch_friction_definitions_dict.setdefault(friction_definition.branchid, []).extend(
+                BranchFrictionDefinition(
+                    branch_id=friction_definition.branchid,
+                    chainage=chainage,
+                    friction_type=friction_type,
+                    friction_value=friction_value
+                )
+                for chainage, friction_value in zip(friction_definition.chainage, friction_definition.frictionvalues)
             )
-            friction_definitions_for_this_branch.append(branch_friction_definition)
-        branch_friction_definitions_dict[friction_definition.branchid] = friction_definitions_for_this_branch
     return friction_definitions_dict, branch_friction_definitions_dict
 
 
 def count_cross_section_types(cross_def_path: Path) -> Dict[Type[CrossSectionDefinition], int]:
-    cross_defs = CrossDefModel(cross_def_path)
-    cross_def_type_counts = dict()
-    for xsec in cross_defs.definition:
-        if type(xsec) in cross_def_type_counts.keys():
-            cross_def_type_counts[type(xsec)] += 1
-        else:
-            cross_def_type_counts[type(xsec)] = 1
-    return cross_def_type_counts
+    return Counter(map(type, parse_ini(CrossDefModel, cross_def_path).definition))
 
 
 def count_structure_types(structures_path: Path) -> Dict[Type[Structure], int]:
-    structures = StructureModel(structures_path)
-    structure_type_counts = dict()
-    for xsec in structures.structure:
-        if type(xsec) in structure_type_counts.keys():
-            structure_type_counts[type(xsec)] += 1
-        else:
-            structure_type_counts[type(xsec)] = 1
-    return structure_type_counts
+    # parse_ini() is cached, so this reuses the model already loaded by extract_from_ini()
+    return Counter(map(type, parse_ini(StructureModel, structures_path).structure))
 
 
-def check_structures(path: Path):
-    structure_counts = count_structure_types(path)
+def check_structures(path: Path, structure_counts: Dict[Type[Structure], int] = None):
+    """:param structure_counts: output of ``count_structure_types(path)``, if already known"""
+    if structure_counts is None:
+        structure_counts = count_structure_types(path)
     for structure_type, count in structure_counts.items():
         if structure_type not in SUPPORTED_STRUCTURES:
             warnings.warn(
@@ -651,10 +927,31 @@ def read_cross_sections(
     Reads cross-section definitions from DHydro, combines them with global friction data, and returns them in a 3Di
     compatible format
     """
-    cross_defs = CrossDefModel(cross_def_path)
+    cross_defs = parse_ini(CrossDefModel, cross_def_path)
+    # Convert the friction data of all cross-section definitions in one batch
+    friction_data = friction_definitions_to_threedi([
+        cross_section_friction_definition(xsec) or GenericFrictionDefinition() for xsec in cross_defs.definition
+    ])
+    # Collect the data of all cross-section definitions first, so that the numeric columns can be rounded in one go
+    xsec_data = [cross_section_data(xsec) for xsec in cross_defs.definition]
+    bank_levels, reference_levels, widths, heights = (
+        none_round_column([data.get(key) for data in xsec_data], 3)
+        for key in ("bank_level", "reference_level", "width", "height")
+    )
     threedi_xsecs_list = [
-        cross_section_def2threedi(cross_section_definition=xsec, friction_definitions=global_friction_definitions)
-        for xsec in cross_defs.definition
+        ThreeDiCrossSectionData(
+            code=xsec.id,
+            bank_level=bank_level,
+            reference_level=reference_level,
+            cross_section_shape=data["shape"],
+            cross_section_width=width,
+            cross_section_height=height,
+            cross_section_table=data.get("table"),
+            friction_data=xsec_friction_data,
+        )
+        for xsec, data, xsec_friction_data, bank_level, reference_level, width, height in zip(
+            cross_defs.definition, xsec_data, friction_data, bank_levels, reference_levels, widths, heights
+        )
     ]
     threedi_xsecs = {xsec.code: xsec for xsec in threedi_xsecs_list}
     return threedi_xsecs
@@ -662,80 +959,14 @@ def read_cross_sections(
 
 if __name__ == "__main__":
     flow_fm_input_path = Path(
-        # r"C:\Users\leendert.vanwolfswin\Documents\overijssel\P1337 DHydro\Overijssel - P1337.dsproj_data\FlowFM\input"
         r"C:\Users\leendert.vanwolfswin\Downloads\Meppelerdiep.dsproj_data\FlowFM\input"
     )
     mdu_path = flow_fm_input_path / "FlowFM.mdu"
-    # cross_def_path = flow_fm_input_path / "crsdef.ini"
-    # cross_defs = CrossDefModel(cross_def_path)
-    #
     friction_definitions, branch_friction_definitions = read_friction(mdu_file=mdu_path)
-    mdu = configparser.ConfigParser()
-    mdu.read(mdu_path)
-    frict_files = mdu["geometry"]["FrictFile"].split(";")
-    for frict_file in frict_files:
-        friction_path = mdu_path.parent / frict_file
-        global_friction_entries = extract_from_ini(friction_path, object_type=FrictGlobal)
+    for friction_path in friction_files(mdu_path):
+        global_friction_entries, _ = extract_from_ini(friction_path, object_type=FrictGlobal)
         print(f"extracted {len(global_friction_entries)} global friction definitions")
-        branch_friction_entries = extract_from_ini(friction_path, object_type=FrictBranch)
+        branch_friction_entries, _ = extract_from_ini(friction_path, object_type=FrictBranch)
         print(f"extracted {len(branch_friction_entries)} branch friction definitions")
 
-    # cross_sections = read_cross_sections(
-    #     cross_def_path=cross_def_path,
-    #     global_friction_definitions=friction_definitions
-    # )
-    #
-    # no_chainage = list()
-    #
-    # mdu = configparser.ConfigParser()
-    # mdu.read(mdu_path)
-    # frict_files = mdu["geometry"]["FrictFile"].split(";")
-    # friction_definitions_dict = dict()
-    # branch_friction_definitions_dict = dict()
-    # for frict_file in frict_files:
-    #     friction_path = mdu_path.parent / frict_file
-    #     friction_definitions = FrictionModel(friction_path)
-    #     # get friction definitions from global entries
-    #     for friction_definition in friction_definitions.global_:
-    #         friction_definitions_dict[friction_definition.frictionid] = GlobalFrictionDefinition(
-    #             friction_id=friction_definition.frictionid,
-    #             friction_type=DHydroFrictionType(friction_definition.frictiontype) if
-    #             friction_definition.frictiontype else None,
-    #             friction_value=friction_definition.frictionvalue
-    #         )
-    #
-    #     for friction_definition in friction_definitions.branch:
-    #         if not friction_definition.chainage:
-    #             no_chainage.append(friction_definition)
-    #             continue
-    #
-    #         if friction_definition.functiontype.lower() != 'constant':
-    #             warnings.warn(
-    #                 f"Friction definition with a function type other than 'constant' are not supported. "
-    #                 f"Function type: {friction_definition.functiontype}. "
-    #                 f"Branch ID: {friction_definition.branchid}. "
-    #                 f"Chainage: {friction_definition.chainage}."
-    #             )
-    #
-    #         friction_definitions_for_this_branch = []
-    #         for i, chainage in enumerate(friction_definition.chainage):
-    #             branch_friction_definition = BranchFrictionDefinition(
-    #                 branch_id=friction_definition.branchid,
-    #                 chainage=chainage,
-    #                 friction_type=DHydroFrictionType(friction_definition.frictiontype) if
-    #                 friction_definition.frictiontype else None,
-    #                 friction_value=friction_definition.frictionvalues[i]
-    #             )
-    #             friction_definitions_for_this_branch.append(branch_friction_definition)
-    #         branch_friction_definitions_dict[friction_definition.branchid] = friction_definitions_for_this_branch
-    #
-    # a = branch_friction_definitions_dict["W4890"]
-
-    # structures_path = flow_fm_input_path / "structures.ini"
-    # s = StructureModel(structures_path)
-    # bridges = [struct for struct in s.structure if struct.type == "bridge"]
-    # # compounds = [struct for struct in s.structure if struct.type == "compound"]
-    # # real_compounds = [c for c in compounds if c.numstructures > 1]
-    # for bridge in bridges:
-    #     print(bridge.inletlosscoeff, bridge.outletlosscoeff)
     print("Klaar")
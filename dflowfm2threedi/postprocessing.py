@@ -1,5 +1,6 @@
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Dict, Set, Tuple
+from typing import List, Dict, Set, Tuple, Iterator
 
 from osgeo import ogr
 
@@ -22,29 +23,41 @@ POINT_OBJECTS = [
     "pump"
 ]
 ALL_OBJECTS = NETWORK_OBJECTS + MAPPING_OBJECTS + POINT_OBJECTS
+EDITED_LAYERS = ALL_OBJECTS + ["connection_node", "cross_section_location"]
 
 
 class ShortChannelDeleter:
     def __init__(self, gpkg: str | Path, threshold: float):
-        self.data_source = ogr.Open(str(gpkg), 1)
-        self.short_channels = self._get_short_channels(threshold=threshold)
+        # The indices are built from a read-only connection, the geopackage is only opened for writing afterwards
+        self.data_source = ogr.Open(str(gpkg), 0)
+        self._cache_layers()
+        # {connection node id: point geometry}, so that replacement connection nodes do not have to be queried.
+        # Connection nodes without geometry are kept with geometry None, so that they can still be deleted
+        self._connection_node_geometries = dict()
+        for connection_node in self._layers["connection_node"]:
+            geometry = connection_node.GetGeometryRef()
+            self._connection_node_geometries[connection_node.GetFID()] = (
+                geometry.Clone() if geometry is not None else None
+            )
+        short_channels = self._get_short_channels(threshold=threshold)
+        # Only the FIDs are kept, the channels are fetched again when they are deleted, because they may have been
+        # updated in the meantime
+        self.short_channels = [channel.GetFID() for channel in short_channels]
         self.indices = {
             layer_name: self._create_index(layer_name) for layer_name in ALL_OBJECTS
         }
         self.reference_dict = dict()
-        self._update_reference_dict(self.short_channels)
+        self._update_reference_dict(short_channels)
+        short_channels = None  # do not keep features of the read-only connection
         self._replaced_connection_nodes = dict()
+        self._reconnect()
 
     def _update_reference_dict(self, channels: List):
         for channel in channels:
-            network_referencing_start = self.get_referencing_features(
-                channel_id=channel.GetFID(),
-                connection_node_id=channel["connection_node_id_start"],
-                target_object_types=NETWORK_OBJECTS
-            )
-            network_referencing_end = self.get_referencing_features(
+            network_referencing_start, network_referencing_end = self._get_referencing_by_endpoints(
                 channel_id=channel.GetFID(),
-                connection_node_id=channel["connection_node_id_end"],
+                start_id=channel["connection_node_id_start"],
+                end_id=channel["connection_node_id_end"],
                 target_object_types=NETWORK_OBJECTS
             )
             self.reference_dict[channel.GetFID()] = {
@@ -52,13 +65,35 @@ class ShortChannelDeleter:
                 "end": network_referencing_end,
             }
 
+    def _cache_layers(self):
+        """Looks up the layers and their field names once, instead of every time they are used"""
+        self._layers = {layer_name: self.data_source.GetLayerByName(layer_name) for layer_name in EDITED_LAYERS}
+        self._field_names = {
+            layer_name: frozenset(field.name for field in layer.schema) for layer_name, layer in self._layers.items()
+        }
+
     def _get_short_channels(self, threshold: float):
-        channels = self.data_source.GetLayerByName("channel")
-        return [channel for channel in channels if channel.GetGeometryRef().Length() < threshold]
+        channels = self._layers["channel"]
+        # A channel can only be shorter than the threshold if its bounding box is smaller than the threshold in both
+        # directions. The bounding box is read from the geometry header by SQLite, so only those candidate channels
+        # have to be fetched to calculate their length
+        geometry_column = channels.GetGeometryColumn()
+        threshold = float(threshold)
+        result_set = self.data_source.ExecuteSQL(
+            f'SELECT "{channels.GetFIDColumn()}" FROM channel '
+            f'WHERE ST_MaxX("{geometry_column}") - ST_MinX("{geometry_column}") < {threshold} '
+            f'AND ST_MaxY("{geometry_column}") - ST_MinY("{geometry_column}") < {threshold}'
+        )
+        try:
+            candidate_fids = [row.GetField(0) for row in result_set]
+        finally:
+            self.data_source.ReleaseResultSet(result_set)
+        candidates = [channels.GetFeature(fid) for fid in candidate_fids]
+        return [channel for channel in candidates if channel.GetGeometryRef().Length() < threshold]
 
-    def _create_index(self, layer_name: str) -> Dict[int, Set[Tuple]]:
+    def _create_index(self, layer_name: str) -> Dict[int, Set[Tuple[str, int]]]:
         """
-        Returns a {connection_node_id: {(connection_node_field, feature), (connection_node_field, feature)}} dict
+        Returns a {connection_node_id: {(connection_node_field, fid), (connection_node_field, fid)}} dict
         """
         index = dict()
         possible_connection_node_field_names = {
@@ -66,49 +101,130 @@ class ShortChannelDeleter:
             "connection_node_id_start",
             "connection_node_id_end"
         }
-        layer = self.data_source.GetLayerByName(layer_name)
-        layer_field_names = {field.name for field in layer.schema}
-        connection_node_fields = possible_connection_node_field_names & layer_field_names
+        layer = self._layers[layer_name]
+        connection_node_fields = possible_connection_node_field_names & self._field_names[layer_name]
         for feature in layer:
             for connection_node_field in connection_node_fields:
                 connection_node_id = feature[connection_node_field]
-                if connection_node_id in index:
-                    index[connection_node_id].add((connection_node_field, feature))
-                else:
-                    index[connection_node_id] = {(connection_node_field, feature)}
+                index.setdefault(connection_node_id, set()).add((connection_node_field, feature.GetFID()))
         return index
 
+    def _delete_features(self, layer_name: str, where: str):
+        """
+        Deletes all features in ``layer_name`` that match SQL ``where`` clause in a single statement, without reading
+        them first
+        """
+        self.data_source.ExecuteSQL(f'DELETE FROM "{layer_name}" WHERE {where}')
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        """Groups all writes in the with-block in a single transaction, which is rolled back on failure"""
+        self.data_source.StartTransaction()
+        try:
+            yield
+        except Exception:
+            self.data_source.RollbackTransaction()
+            raise
+        self.data_source.CommitTransaction()
+
+    def _execute_scalar(self, sql: str):
+        """Executes ``sql`` and returns the first value of the first row of the result"""
+        result_set = self.data_source.ExecuteSQL(sql)
+        try:
+            return result_set.GetNextFeature().GetField(0)
+        finally:
+            self.data_source.ReleaseResultSet(result_set)
+
+    @contextmanager
+    def _deferred_spatial_index(self, layer_names: List[str]) -> Iterator[None]:
+        """
+        Disables the spatial index of the given layers for the duration of the with-block, and rebuilds it in a single
+        pass afterwards, instead of updating it for every edited or deleted feature
+        """
+        spatial_indices = []
+        for layer_name in layer_names:
+            geometry_column = self._layers[layer_name].GetGeometryColumn()
+            if geometry_column and self._execute_scalar(
+                    f"SELECT HasSpatialIndex('{layer_name}', '{geometry_column}')"
+            ):
+                self._execute_scalar(f"SELECT DisableSpatialIndex('{layer_name}', '{geometry_column}')")
+                spatial_indices.append((layer_name, geometry_column))
+        try:
+            yield
+        finally:
+            for layer_name, geometry_column in spatial_indices:
+                self._execute_scalar(f"SELECT CreateSpatialIndex('{layer_name}', '{geometry_column}')")
+
+    @contextmanager
+    def _temporary_attribute_index(self, layer_name: str, field_name: str) -> Iterator[None]:
+        """
+        Creates an index on ``field_name`` of ``layer_name`` for the duration of the with-block, so that deleting the
+        features with a given value does not scan the whole table every time. The index is dropped afterwards, to leave
+        the schema of the geopackage unchanged.
+        """
+        index_name = f"idx_{layer_name}_{field_name}_short_channel_deleter"
+        self.data_source.ExecuteSQL(f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{layer_name}" ("{field_name}")')
+        try:
+            yield
+        finally:
+            self.data_source.ExecuteSQL(f'DROP INDEX IF EXISTS "{index_name}"')
+
     def _reconnect(self):
+        """(Re)opens the geopackage for writing"""
         gpkg = self.data_source.GetName()
+        self._layers = None  # release the layers, so that the data source is actually closed
         self.data_source = None
         self.data_source = ogr.Open(gpkg, 1)
+        self._cache_layers()
 
     def replaced_connection_node_id(self, old_connection_node_id: int):
         current_id = old_connection_node_id
+        replaced_ids = []
         while current_id in self._replaced_connection_nodes:
+            replaced_ids.append(current_id)
             current_id = self._replaced_connection_nodes[current_id]
+        # Point all replaced connection nodes on the way directly to the current one, so the chain is walked only once
+        for replaced_id in replaced_ids:
+            self._replaced_connection_nodes[replaced_id] = current_id
         return current_id
 
     def get_referencing_features(self, channel_id, connection_node_id, target_object_types: List = None) -> List:
         """
-        Returns list of (layer_name, field_name, feature) tuples
+        Returns list of (layer_name, field_name, fid) tuples
         """
         result = list()
-        for layer_name, all_references in self.indices.items():
-            # all_references is a set of (field_name, feature) tuples
-            if layer_name in target_object_types:
-                if connection_node_id in all_references:
-                    references = all_references[connection_node_id]
-                    for field_name, feature in references:
-                        if not (layer_name == "channel" and feature.GetFID() == channel_id):  # exclude channel self-references
-                            result.append((layer_name, field_name, feature))
+        for layer_name in target_object_types:
+            # all_references is a {connection_node_id: {(field_name, fid), ...}} dict
+            all_references = self.indices.get(layer_name)
+            if not all_references:
+                continue
+            for field_name, fid in all_references.get(connection_node_id, ()):
+                if not (layer_name == "channel" and fid == channel_id):  # exclude channel self-references
+                    result.append((layer_name, field_name, fid))
         return result
 
+    def _get_referencing_by_endpoints(
+            self, channel_id, start_id, end_id, target_object_types: List
+    ) -> Tuple[List, List]:
+        """
+        Returns the ``get_referencing_features()`` of both the start and the end connection node of a channel,
+        looking through the indices only once
+        """
+        start_result = list()
+        end_result = list()
+        for layer_name in target_object_types:
+            all_references = self.indices[layer_name]
+            for connection_node_id, result in ((start_id, start_result), (end_id, end_result)):
+                for field_name, fid in all_references.get(connection_node_id, ()):
+                    if not (layer_name == "channel" and fid == channel_id):  # exclude channel self-references
+                        result.append((layer_name, field_name, fid))
+        return start_result, end_result
+
     def delete_channel(self, channel):
         channel_id = channel.GetFID()
         try:
             references = self.reference_dict[channel_id]
-            # references is a dict that contains two lists of (layer_name, field_name, feature) tuples
+            # references is a dict that contains two lists of (layer_name, field_name, fid) tuples
             # one for "start" and one for "end"
         except KeyError:
             raise RuntimeError(
@@ -116,8 +232,8 @@ class ShortChannelDeleter:
             )
 
         # Do not delete the channel if any other object connects its start and end
-        start_referencing_features = {feature for _, _, feature in references["start"]}
-        end_referencing_features = {feature for _, _, feature in references["end"]}
+        start_referencing_features = {(layer_name, fid) for layer_name, _, fid in references["start"]}
+        end_referencing_features = {(layer_name, fid) for layer_name, _, fid in references["end"]}
         if start_referencing_features & end_referencing_features:
             return
 
@@ -135,40 +251,36 @@ class ShortChannelDeleter:
             target_object_types=ALL_OBJECTS
         )
         # Update all referencing features
-        for layer_name, field_name, feature in referencing_features:
+        for layer_name, field_name, fid in referencing_features:
             self.replace_connection_node(
-                data_source=self.data_source,
                 layer_name=layer_name,
-                feature_fid=feature.GetFID(),
+                feature_fid=fid,
                 delete_id=connection_node_id_to_delete,
                 replacement_id=connection_node_id_replacement,
             )
             if layer_name == "channel":
-                self._update_reference_dict(channels=[feature])
+                # fetch the channel again, so that its references are based on its updated connection node ids
+                updated_channel = self._layers["channel"].GetFeature(fid)
+                if updated_channel is not None:
+                    self._update_reference_dict(channels=[updated_channel])
 
         # Delete all cross-section locations that reference this channel
-        cross_section_locations = self.data_source.GetLayerByName("cross_section_location")
-        cross_section_locations.SetAttributeFilter(f"channel_id = {channel_id}")
-        for cross_section_location in cross_section_locations:
-            cross_section_locations.DeleteFeature(cross_section_location.GetFID())
-
-        # Delete the connection node
-        connection_nodes = self.data_source.GetLayerByName("connection_node")
-        connection_nodes.SetAttributeFilter(f"id = {connection_node_id_to_delete}")
-        for connection_node in connection_nodes:
-            connection_nodes.DeleteFeature(connection_node.GetFID())
+        self._delete_features("cross_section_location", f"channel_id = {int(channel_id)}")
+
+        # Delete the connection node (its id is its FID)
+        if connection_node_id_to_delete in self._connection_node_geometries:
+            del self._connection_node_geometries[connection_node_id_to_delete]
+            self._layers["connection_node"].DeleteFeature(connection_node_id_to_delete)
         self._replaced_connection_nodes[connection_node_id_to_delete] = connection_node_id_replacement
 
         # Delete the channel
-        channels = self.data_source.GetLayerByName("channel")
-        channels.DeleteFeature(channel.GetFID())
+        self._layers["channel"].DeleteFeature(channel_id)
 
         # Remove the channel from self.reference_dict
         self.reference_dict.pop(channel_id)
 
     def replace_connection_node(
             self,
-            data_source,
             layer_name,
             feature_fid,
             delete_id,
@@ -178,13 +290,12 @@ class ShortChannelDeleter:
         Update the attribute of a feature in ``layer_name`` that refers to a deleted connection node
         And update the geometry of that feature
         """
-        layer = data_source.GetLayerByName(layer_name)
+        layer = self._layers[layer_name]
         feature = layer.GetFeature(feature_fid)
         if layer_name == "channel" and feature is None:
             return  # channel has already been deleted
 
-        field_names = [field.name for field in layer.schema]
-        if "connection_node_id" in field_names:
+        if "connection_node_id" in self._field_names[layer_name]:
             if feature["connection_node_id"] == delete_id:
                 field_to_be_updated = "connection_node_id"
                 first_or_last = "first"
@@ -202,10 +313,7 @@ class ShortChannelDeleter:
             )
         feature.SetField(field_to_be_updated, replacement_id)  # Replace with the new value
         target_geom = feature.GetGeometryRef()
-        connection_node_layer = data_source.GetLayerByName("connection_node")
-        connection_node_layer.SetAttributeFilter(f"id={replacement_id}")
-        replacement_connection_node = connection_node_layer.GetNextFeature()
-        vertex_geom = replacement_connection_node.GetGeometryRef()
+        vertex_geom = self._connection_node_geometries[replacement_id]
         move_vertex_in_geometry(target_geom=target_geom, new_vertex=vertex_geom, first_or_last=first_or_last)
         feature.SetGeometry(target_geom)
 
@@ -214,110 +322,103 @@ class ShortChannelDeleter:
         feature_id = feature.GetFID()
         feature = None  # Free memory
 
-        # Update index for this layer
+        # Update index for this layer: move the updated feature from the deleted to the replacement connection node
         index = self.indices[layer_name]
         if delete_id in index:  # TODO fix this properly.
-            old_index_entry = index[delete_id]
-            new_index_entry = set()
-            for connection_node_field, feature in old_index_entry:
-                index_entry_item = (connection_node_field, feature)
-                feature_layer_name = feature.GetDefnRef().GetName()
-                if feature_layer_name == layer_name and connection_node_field == field_to_be_updated:
-                    if replacement_id in index:
-                        index[replacement_id].add(index_entry_item)
-                    else:
-                        index[replacement_id] = {index_entry_item}
-                else:
-                    new_index_entry.add(index_entry_item)
-            if new_index_entry:
-                index[delete_id] = new_index_entry
-            else:
-                index.pop(delete_id)
-            self.indices[layer_name] = index
+            index_entry_item = (field_to_be_updated, feature_id)
+            if index_entry_item in index[delete_id]:
+                index[delete_id].discard(index_entry_item)
+                index.setdefault(replacement_id, set()).add(index_entry_item)
+            if not index[delete_id]:
+                del index[delete_id]
         else:
             print(f"Connection node {delete_id} not found in index for {layer_name} when updating feature {feature_id}. "
                   f"Not updating its index!")
 
     def delete_zero_length_channels(self, channel_ids: List = None):
         """Deletes all channels that have connection_node_id_start == connection_node_id_end"""
-        channels = self.data_source.GetLayerByName("channel")
-        cross_section_locations = self.data_source.GetLayerByName("cross_section_location")
+        channels = self._layers["channel"]
         if channel_ids:
             channels.SetAttributeFilter(f"id in ({','.join(channel_ids)})")
 
         deleted_fids = []
-        for channel in channels:
+        # Read the channels up front, because executing SQL statements on the data source resets reading of its layers
+        for channel in list(channels):
             if channel["connection_node_id_start"] == channel["connection_node_id_end"]:
-                # cross_section_locations.SetAttributeFilter(f"channel_id = {channel['id']}")
-                cross_section_locations.SetAttributeFilter(f"channel_id = {channel.GetFID()}")
-                for cross_section_location in cross_section_locations:
-                    cross_section_locations.DeleteFeature(cross_section_location.GetFID())
                 fid = channel.GetFID()
+                self._delete_features("cross_section_location", f"channel_id = {int(fid)}")
                 channels.DeleteFeature(fid)
                 deleted_fids.append(fid)
 
-                # Update index for channel layer
+                # Update index for channel layer. Both ends of the channel refer to the same connection node, so its
+                # index entries are known without searching for them
                 connection_node_id = channel["connection_node_id_start"]
                 index = self.indices["channel"]
-                new_index_entry = set()
-                for connection_node_field, feature in index[connection_node_id]:
-                    if not feature.GetFID() == fid:
-                        index_entry_item = (connection_node_field, feature)
-                        new_index_entry.add(index_entry_item)
-                if new_index_entry:
-                    index[connection_node_id] = new_index_entry
-                else:
+                index[connection_node_id] -= {("connection_node_id_start", fid), ("connection_node_id_end", fid)}
+                if not index[connection_node_id]:
                     index.pop(connection_node_id)
-                self.indices["channel"] = index
 
         # update administration
-        self.short_channels = [channel for channel in self.short_channels if channel.GetFID() not in deleted_fids]
+        self.short_channels = [fid for fid in self.short_channels if fid not in deleted_fids]
 
     def update_pump_map_geometries(self):
         self._reconnect()
         # Get layers
-        pumps = self.data_source.GetLayer("pump")
-        connection_nodes = self.data_source.GetLayer("connection_node")
-        pump_maps = self.data_source.GetLayer("pump_map")
-
-        # Build pump and connection_node geometry dictionaries
-        pump_geom_dict = {}
-        for feature in pumps:
-            pump_id = feature.GetFID()
-            geom = feature.GetGeometryRef().Clone()
-            pump_geom_dict[pump_id] = geom
-        pumps.ResetReading()
+        pumps = self._layers["pump"]
+        pump_maps = self._layers["pump_map"]
 
-        connection_node_geom_dict = {}
-        for feature in connection_nodes:
-            connection_node_id = feature.GetFID()
-            geom = feature.GetGeometryRef().Clone()
-            connection_node_geom_dict[connection_node_id] = geom
-        connection_nodes.ResetReading()
+        # Build a pump coordinate dictionary. The connection node geometries are already known
+        pump_points = {feature.GetFID(): feature.GetGeometryRef().GetPoint_2D() for feature in pumps}
+        pumps.ResetReading()
 
         # Update each pump_map feature
-        for feature in pump_maps:
-            pump_id = feature.GetField("pump_id")
-            connection_node_id = feature.GetField("connection_node_id_end")
+        with self._transaction():
+            for feature in pump_maps:
+                pump_id = feature.GetField("pump_id")
+                connection_node_id = feature.GetField("connection_node_id_end")
 
-            pump_geom = pump_geom_dict.get(pump_id)
-            connection_node_geom = connection_node_geom_dict.get(connection_node_id)
+                pump_point = pump_points.get(pump_id)
+                connection_node_geom = self._connection_node_geometries.get(connection_node_id)
 
-            if pump_geom is not None and connection_node_geom is not None:
-                line = ogr.Geometry(ogr.wkbLineString)
-                line.AddPoint(*pump_geom.GetPoint_2D())
-                line.AddPoint(*connection_node_geom.GetPoint_2D())
+                if pump_point is not None and connection_node_geom is not None:
+                    line = ogr.Geometry(ogr.wkbLineString)
+                    line.AddPoint(*pump_point)
+                    line.AddPoint(*connection_node_geom.GetPoint_2D())
 
-                feature.SetGeometry(line)
-                pump_maps.SetFeature(feature)
+                    feature.SetGeometryDirectly(line)
+                    pump_maps.SetFeature(feature)
+
+    def _layers_to_edit(self, channel_fids: List[int]) -> List[str]:
+        """
+        Returns the names of the layers that deleting the channels with ``channel_fids`` may edit: the layers that
+        reference their connection nodes, and the connection nodes and cross-section locations themselves
+        """
+        if not channel_fids:
+            return []
+        connection_node_ids = set()
+        for fid in channel_fids:
+            channel = self._layers["channel"].GetFeature(fid)
+            if channel is not None:
+                connection_node_ids.update((channel["connection_node_id_start"], channel["connection_node_id_end"]))
+        return ["connection_node", "cross_section_location"] + [
+            layer_name for layer_name in ALL_OBJECTS if not connection_node_ids.isdisjoint(self.indices[layer_name])
+        ]
 
     def run(self, channel_ids: List = None):
-        self.delete_zero_length_channels(channel_ids=channel_ids)
-        for channel in self.short_channels:
-            if channel_ids:
-                if channel.GetFID() in channel_ids:
-                    self.delete_channel(channel)
-            else:
+        channel_fids = [fid for fid in self.short_channels if not channel_ids or fid in channel_ids]
+        # All deletions and updates are committed at once. The spatial indices are only deferred for the layers that
+        # are edited, inside the transaction, so that a rollback restores them. update_pump_map_geometries()
+        # reconnects to the geopackage, so it uses a transaction of its own
+        with (
+            self._transaction(),
+            self._temporary_attribute_index("cross_section_location", "channel_id"),
+            self._deferred_spatial_index(self._layers_to_edit(channel_fids)),
+        ):
+            self.delete_zero_length_channels(channel_ids=channel_ids)
+            for fid in channel_fids:
+                channel = self._layers["channel"].GetFeature(fid)
+                if channel is None:
+                    continue  # channel has already been deleted
                 self.delete_channel(channel)
         self.update_pump_map_geometries()
 
@@ -1,10 +1,14 @@
 import re
+from itertools import chain
 from pathlib import Path
 from typing import List
 
+ID_PATTERN = re.compile(r"\bid\b\s*['\"]?([^'\"]+)", re.IGNORECASE)
+FRICTION_RECORD_START_PATTERN = re.compile(r"^(BDFR|GLFR|STFR|CRFR)")
+
 
 def get_id_value(text):
-    match = re.search(r"\bid\b\s*['\"]?([^'\"]+)", text, re.IGNORECASE)
+    match = ID_PATTERN.search(text)
     return match.group(1) if match else None
 
 
@@ -14,36 +18,29 @@ def deduplicate_friction_file(input_file, output_file):
     If there are multiple entries for 1 ID, only the last entry in the file is preserved.
     """
 
-    with open(input_file, "r", encoding="utf-8") as f:
-        content = f.readlines()
-
     records = dict()
     record_lines = list()
     glfr = list()
-    start_pattern = r"^(BDFR|GLFR|STFR|CRFR)"
     end_pattern = "*******"
-    for line in content:
-        line = line.strip("\n")
-        if len(record_lines) == 0 and re.match(start_pattern, line):
-            end_pattern = line[:4].lower()
-        record_lines.append(line)
-        if line.endswith(end_pattern):
-            record = "\n".join(record_lines)
-            if end_pattern == "GLFR":
-                glfr.append(end_pattern)
-            else:
-                record_id = get_id_value(record)
-                records[record_id] = record
-            record_lines = list()
+    # The file is read line by line, instead of reading all lines into a list first
+    with open(input_file, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip("\n")
+            if len(record_lines) == 0 and FRICTION_RECORD_START_PATTERN.match(line):
+                end_pattern = line[:4].lower()
+            record_lines.append(line)
+            if line.endswith(end_pattern):
+                record = "\n".join(record_lines)
+                if end_pattern == "GLFR":
+                    glfr.append(end_pattern)
+                else:
+                    record_id = get_id_value(record)
+                    records[record_id] = record
+                record_lines = list()
 
     # Write cleaned file with unique records
     with open(output_file, "w", encoding="utf-8") as f:
-        for record in glfr:
-            f.write(record)
-            f.write("\n")
-        for record in records.values():
-            f.write(record)
-            f.write("\n")
+        f.writelines(f"{record}\n" for record in chain(glfr, records.values()))
 
 
 # Example usage